@@ -0,0 +1,107 @@
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+
+from PyQt5.QtCore import PYQT_VERSION_STR, QT_VERSION_STR
+from PyQt5.QtWidgets import QApplication
+
+from .cases import CASES, SceneConfig
+from .memory import footprint
+from .scene import parse_mix
+
+
+def revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(times: list) -> dict:
+    return {
+        'runs': len(times),
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.fmean(times),
+        'max': max(times),
+    }
+
+
+def compare(results: dict, baseline: dict) -> None:
+    for name, result in results.items():
+        old = baseline.get('results', {}).get(name)
+        if old:
+            ratio = result['median'] / old['median'] if old['median'] else float('inf')
+            print(f'{name:12} {old["median"] * 1000:10.2f} ms -> {result["median"] * 1000:10.2f} ms  x{ratio:.2f}',
+                  file=sys.stderr)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Headless shape editor benchmarks')
+    parser.add_argument('--shapes', type=int, default=2000, help='number of leaf shapes in the scene')
+    parser.add_argument('--mix', default='circle,rectangle,triangle', help='weights, e.g. circle=2,triangle=1')
+    parser.add_argument('--grouped', type=float, default=0.2, help='fraction of shapes placed in groups')
+    parser.add_argument('--depth', type=int, default=2, help='group nesting depth')
+    parser.add_argument('--selection', type=float, default=0.1, help='fraction of top-level items selected')
+    parser.add_argument('--samples', type=int, default=200, help='clicks / drag steps per run')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--size', default='1280x800', help='window size')
+    parser.add_argument('--case', action='append', choices=sorted(CASES), help='run only these cases')
+    parser.add_argument('--no-memory', action='store_true', help='skip the bytes-per-shape measurement')
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    parser.add_argument('--compare', help='JSON from an earlier run to compare medians against')
+    args = parser.parse_args(argv)
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    import main as editor
+    window = editor.Window()
+    width, height = map(int, args.size.split('x'))
+    window.resize(width, height)
+    window.show()
+    app.processEvents()
+
+    config = SceneConfig(args.shapes, parse_mix(args.mix), args.grouped, args.depth, args.seed,
+                         args.selection, args.samples)
+    results = {}
+    for name in args.case or CASES:
+        times = [CASES[name](window, config) for _ in range(args.repeat)]
+        results[name] = summarize(times)
+        print(f'{name:12} {results[name]["median"] * 1000:10.2f} ms', file=sys.stderr)
+    window.storage.clear()
+    window.close()
+    memory = None
+    if not args.no_memory:
+        memory = footprint(config.shapes, config.mix, config.seed)
+        print(f'memory       {memory["per_shape"]:10.0f} B/shape + {memory["storage_per_shape"]:.0f} B/shape indexed',
+              file=sys.stderr)
+
+    report = {
+        'revision': revision(),
+        'python': platform.python_version(),
+        'qt': QT_VERSION_STR,
+        'pyqt': PYQT_VERSION_STR,
+        'platform': app.platformName(),
+        'scene': config._asdict(),
+        'window': [width, height],
+        'results': results,
+        'memory': memory,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
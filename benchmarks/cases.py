@@ -0,0 +1,171 @@
+import os
+import random
+import tempfile
+import time
+from collections import namedtuple
+
+from PyQt5.QtCore import QEvent, QPoint, Qt
+from PyQt5.QtGui import QImage, QKeyEvent, QMouseEvent
+from PyQt5.QtWidgets import QApplication
+
+from src.storage import Storage
+from .scene import build_scene
+from .startup import measure
+
+SceneConfig = namedtuple('SceneConfig', ['shapes', 'mix', 'grouped', 'depth', 'seed', 'selection', 'samples'])
+CASES = {}
+
+
+def case(name):
+    def register(function):
+        CASES[name] = function
+        return function
+    return register
+
+
+def reset_scene(window, config: SceneConfig) -> list:
+    window.storage.clear()
+    shapes = build_scene(window.storage, window.canvasrect, config.shapes, config.mix,
+                         config.grouped, config.depth, config.seed)
+    window.update()
+    QApplication.processEvents()
+    return shapes
+
+
+def select(window, config: SceneConfig) -> None:
+    storage = window.storage
+    rnd = random.Random(config.seed)
+    count = max(2, int(len(storage) * config.selection))
+    with storage.batch():
+        for item in rnd.sample(list(storage), min(count, len(storage))):
+            item.setStatus(True)
+    window.update()
+    QApplication.processEvents()
+
+
+def elapsed(function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def mouse_event(kind, point: QPoint) -> QMouseEvent:
+    return QMouseEvent(kind, point, Qt.LeftButton, Qt.LeftButton, Qt.NoModifier)
+
+
+### HIT TESTING ###
+@case('hit_test')
+def hit_test(window, config: SceneConfig) -> float:
+    shapes = reset_scene(window, config)
+    rnd = random.Random(config.seed)
+    events = [mouse_event(QEvent.MouseButtonPress, shape.rect.center())
+              for shape in rnd.choices(shapes, k=config.samples)]
+
+    def run():
+        for event in events:
+            with window.storage.batch():
+                window.check(event)
+
+    return elapsed(run)
+
+
+### RENDERING ###
+def render(window) -> None:
+    image = QImage(window.size(), QImage.Format_ARGB32_Premultiplied)
+    image.fill(Qt.white)
+    window.render(image)
+
+
+@case('paint_cold')
+def paint_cold(window, config: SceneConfig) -> float:
+    reset_scene(window, config)
+    select(window, config)
+    window.storage.invalidate()
+    return elapsed(render, window)
+
+
+@case('paint_warm')
+def paint_warm(window, config: SceneConfig) -> float:
+    reset_scene(window, config)
+    select(window, config)
+    render(window)
+    return elapsed(render, window)
+
+
+### FILES ###
+def file_case(extension, load):
+    def run(window, config: SceneConfig) -> float:
+        reset_scene(window, config)
+        fd, filename = tempfile.mkstemp(suffix=extension)
+        os.close(fd)
+        try:
+            if not load:
+                return elapsed(window.storage.save, filename)
+            window.storage.save(filename)
+            return elapsed(window.storage.load, filename)
+        finally:
+            os.remove(filename)
+    return run
+
+
+for _extension in ('xml', 'shb'):
+    CASES[f'save_{_extension}'] = file_case('.' + _extension, load=False)
+    CASES[f'load_{_extension}'] = file_case('.' + _extension, load=True)
+
+
+### EDITING ###
+@case('group')
+def group(window, config: SceneConfig) -> float:
+    reset_scene(window, config)
+    select(window, config)
+    return elapsed(window.groupElements)
+
+
+@case('delete')
+def delete(window, config: SceneConfig) -> float:
+    reset_scene(window, config)
+    select(window, config)
+    return elapsed(window.keyPressEvent, QKeyEvent(QEvent.KeyPress, Qt.Key_Delete, Qt.NoModifier))
+
+
+@case('drag')
+def drag(window, config: SceneConfig) -> float:
+    reset_scene(window, config)
+    select(window, config)
+    start = window.storage.selectionBounds().center()
+    window.mouse_pos = start
+    # wiggle back and forth so the selection never hits the canvas border
+    events = [mouse_event(QEvent.MouseMove, start + QPoint(step % 2 * 3, step % 2 * 2))
+              for step in range(1, config.samples + 1)]
+
+    def run():
+        for event in events:
+            window.mouseMoveEvent(event)
+            QApplication.processEvents()
+
+    try:
+        return elapsed(run)
+    finally:
+        window.mouse_pos = None
+
+
+### STARTUP ###
+@case('startup')
+def startup(window, config: SceneConfig) -> float:
+    return measure()['first_frame']
+
+
+def startup_case(mark):
+    def run(window, config: SceneConfig) -> float:
+        with tempfile.TemporaryDirectory() as directory:
+            document = os.path.join(directory, 'scene.shb')
+            storage = Storage()
+            build_scene(storage, window.canvasrect, config.shapes, config.mix, config.grouped, config.depth,
+                        config.seed)
+            storage.save(document)
+            return measure(document)[mark]
+    return run
+
+
+CASES['startup_open'] = startup_case('first_frame')
+CASES['startup_loaded'] = startup_case('loaded')
@@ -0,0 +1,31 @@
+import gc
+import random
+import sys
+import tracemalloc
+
+from PyQt5.QtCore import QRect
+
+from src.storage import Storage
+from .scene import random_shapes
+
+
+def footprint(count: int, mix: dict, seed: int = 0) -> dict:
+    # Python-side bytes per shape; the C++ halves of QRect/QColor/QPolygon are not traced
+    gc.collect()
+    tracemalloc.start()
+    try:
+        shapes = random_shapes(QRect(0, 0, 4000, 4000), count, mix, random.Random(seed))
+        gc.collect()
+        created, _ = tracemalloc.get_traced_memory()
+        storage = Storage()
+        storage.addItems(shapes)
+        gc.collect()
+        stored, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'shapes': count,
+        'instance': sum(map(sys.getsizeof, shapes)) / count,
+        'per_shape': created / count,
+        'storage_per_shape': (stored - created) / count,
+    }
@@ -0,0 +1,60 @@
+import random
+
+from PyQt5.QtCore import QPoint, QRect
+from PyQt5.QtGui import QColor
+
+from src.shapes import Circle, Rectangle, Triangle, Group
+
+SHAPE_KINDS = {'circle': Circle, 'rectangle': Rectangle, 'triangle': Triangle}
+DEFAULT_MIX = {'circle': 1.0, 'rectangle': 1.0, 'triangle': 1.0}
+GROUP_SIZE = (2, 8)
+MARGIN = 40
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in filter(None, text.split(',')):
+        name, _, weight = part.partition('=')
+        name = name.strip().lower()
+        if name not in SHAPE_KINDS:
+            raise ValueError(f"unknown shape kind '{name}'")
+        mix[name] = float(weight) if weight else 1.0
+    return mix or dict(DEFAULT_MIX)
+
+
+def random_shapes(canvas: QRect, count: int, mix: dict, rnd: random.Random) -> list:
+    kinds = [SHAPE_KINDS[name] for name in mix]
+    weights = list(mix.values())
+    area = canvas.adjusted(MARGIN, MARGIN, -MARGIN, -MARGIN)
+    shapes = []
+    for kind in rnd.choices(kinds, weights, k=count):
+        point = QPoint(rnd.randint(area.left(), area.right()), rnd.randint(area.top(), area.bottom()))
+        color = QColor.fromRgb(rnd.randrange(256), rnd.randrange(256), rnd.randrange(256))
+        shapes.append(kind(point, color, length=rnd.randint(20, 60)))
+    return shapes
+
+
+def nest(shapes: list, depth: int, rnd: random.Random) -> list:
+    for _ in range(depth):
+        if len(shapes) < GROUP_SIZE[0]:
+            break
+        groups = []
+        while shapes:
+            size = rnd.randint(*GROUP_SIZE)
+            group = Group()
+            group.addChildren(shapes[:size])
+            shapes = shapes[size:]
+            groups.append(group)
+        shapes = groups
+    return shapes
+
+
+def build_scene(storage, canvas: QRect, count: int, mix: dict = None, grouped: float = 0.0,
+                depth: int = 1, seed: int = 0) -> list:
+    rnd = random.Random(seed)
+    shapes = random_shapes(canvas, count, mix or DEFAULT_MIX, rnd)
+    split = int(len(shapes) * grouped)
+    items = shapes[split:] + (nest(shapes[:split], depth, rnd) if split else [])
+    rnd.shuffle(items)
+    storage.addItems(items)
+    return shapes
@@ -0,0 +1,71 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+CHILD_TIMEOUT = 120
+
+# Startup runs in a fresh interpreter so imports are cold. time.monotonic() is system-wide,
+# so the parent's clock at spawn and the child's marks can be compared directly.
+
+
+def measure(document: str = None) -> dict:
+    args = [sys.executable, '-m', 'benchmarks.startup']
+    if document is not None:
+        args.append(document)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    start = time.monotonic()
+    output = subprocess.run(args, cwd=root, capture_output=True, text=True, check=True,
+                            timeout=CHILD_TIMEOUT).stdout
+    marks = json.loads(output.strip().splitlines()[-1])
+    return {name: mark - start for name, mark in marks.items()}
+
+
+def child(argv) -> int:
+    marks = {'interpreter': time.monotonic()}
+    from PyQt5.QtCore import QEvent, QObject, QTimer
+    from PyQt5.QtWidgets import QApplication
+
+    app = QApplication(sys.argv[:1])
+    import main as editor
+    marks['imported'] = time.monotonic()
+
+    def done() -> None:
+        if 'first_frame' in marks and (not argv or 'loaded' in marks):
+            app.quit()
+
+    def mark(name) -> None:
+        if name not in marks:
+            marks[name] = time.monotonic()
+            done()
+
+    class FirstFrame(QObject):
+        window = None
+
+        def eventFilter(self, watched, event):
+            if event.type() == QEvent.Paint and watched is self.window:
+                # stamped once the paint event has been handled
+                QTimer.singleShot(0, lambda: mark('first_frame'))
+            return False
+
+    probe = FirstFrame()
+    app.installEventFilter(probe)
+    window = probe.window = editor.launch(argv)
+    marks['shown'] = time.monotonic()
+    load_finished = window._loadFinished
+
+    def loaded(filename, result):
+        load_finished(filename, result)
+        mark('loaded')
+
+    window._loadFinished = loaded
+    QTimer.singleShot(CHILD_TIMEOUT * 1000, app.quit)
+    app.exec()
+    window.close()
+    print(json.dumps(marks))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(child(sys.argv[1:]))
@@ -1,21 +1,33 @@
 import sys
 
 from PyQt5 import QtWidgets
-from PyQt5.QtWidgets import QApplication, QMainWindow, QColorDialog, QFileDialog, QMessageBox
-from PyQt5.QtGui import QPainter, QColor
-from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QApplication, QMainWindow, QColorDialog, QFileDialog, QMessageBox, QProgressDialog
+from PyQt5.QtGui import QPainter, QColor, QPixmap, QKeySequence
+from PyQt5.QtCore import Qt, QRect, QRectF, QEvent, QTimer
 from forms.main_form import Ui_MainWindow
 import logging
 
 from src.shapes import *
+from src.background import BackgroundTask, save_task, load_task
+from src.instrumentation import instrumentation
+from src.journal import Journal
+from src.render import BatchRenderer
 from src.tree_view_storage import TreeViewStorage
 
+logger = logging.getLogger(__name__)
+
 STEP_CHANGE_SIZE = 10 // 2
+FILE_FILTERS = 'XML (*.xml);;Binary (*.shb)'
+PROFILE_FILTERS = 'Chrome trace (*.json);;JSON (*.json)'
 
 
 class Window(QMainWindow):
     MOVE_KEYS = [Qt.Key_W, Qt.Key_A, Qt.Key_S, Qt.Key_D]
     CHANGE_SIZE_KEYS = [Qt.Key_Equal, Qt.Key_Minus]
+    OVERLAY_SIZE = (230, 58)
+    OVERLAY_REFRESH_MS = 500
+    JOURNAL_FLUSH_MS = 1000
+    COMPACT_INTERVAL_MS = 60000
     STEP_MOVE = 5
     MINIMUM_WIDTH = 750
     MINIMUM_HEIGHT = 200
@@ -31,6 +43,7 @@ class Window(QMainWindow):
         self.ui.splitter.setSizes([200, self.window_width - 200])
         self.storage = TreeViewStorage(parent=self.ui.treeView)
         self.ui.treeView.setModel(self.storage)
+        self.ui.treeView.setUniformRowHeights(True)
         Circle.set_linked_widget(self.ui.circlebutton)
         Rectangle.set_linked_widget(self.ui.rectanlebutton)
         Triangle.set_linked_widget(self.ui.trianglebutton)
@@ -42,6 +55,26 @@ class Window(QMainWindow):
         self.currentColor = self.INITIAL_COLOR
         self.ui.groupButton.clicked.connect(self.groupElements)
         self.mouse_pos = None
+        self._static_layer = None
+        self._static_revision = None
+        self._tasks = set()
+        self._canvasrect = None
+        self.ui.canvas.installEventFilter(self)
+        self.ui.splitter.splitterMoved.connect(self.invalidateCanvasRect)
+        self._renderer = BatchRenderer()
+        self._overlay = False
+        self._profiling = instrumentation.enabled
+        self._overlay_timer = QTimer(self)
+        self._overlay_timer.timeout.connect(lambda: super(Window, self).update(self.overlayRect()))
+        self.storage.journal = Journal()
+        # filename -> saves waiting for the one currently writing that file
+        self._writing = {}
+        self._journal_timer = QTimer(self)
+        self._journal_timer.timeout.connect(lambda: self.storage.journal.flush())
+        self._journal_timer.start(self.JOURNAL_FLUSH_MS)
+        self._compact_timer = QTimer(self)
+        self._compact_timer.timeout.connect(self.compactJournal)
+        self._compact_timer.start(self.COMPACT_INTERVAL_MS)
 
     @property
     def currentColor(self):
@@ -50,32 +83,39 @@ class Window(QMainWindow):
     @currentColor.setter
     def currentColor(self, color: QColor):
         if color != self._currentColor:
-            for elem in self.storage.getActiveItems():
-                elem.color = color
-            self.storage.deact_all()
+            self.storage.recolorAllActive(color)
             self._currentColor = color
             self.ui.colorButton.setStyleSheet(f'background: {color.name()}')
 
     def resizeEvent(self, a0):
-        minimal_height = self.MINIMUM_HEIGHT
-        minimal_width = self.MINIMUM_WIDTH
-        for elem in self.storage:
-            minimal_height = max(minimal_height, elem.rect.bottomRight().y())
-            minimal_width = max(minimal_width, elem.rect.bottomRight().x())
+        self.invalidateCanvasRect()
+        bounds = self.storage.contentBounds()
+        minimal_height = max(self.MINIMUM_HEIGHT, bounds.bottom())
+        minimal_width = max(self.MINIMUM_WIDTH, bounds.right())
         self.setMinimumSize(minimal_width, minimal_height)
 
     @property
     def canvasrect(self):
-        rect = self.ui.canvas.geometry()
-        widget = self.ui.canvas
-        while (widget := widget.parent()) is not self:
-            rect = rect.translated(widget.geometry().topLeft())
-        return rect
+        if self._canvasrect is None:
+            rect = self.ui.canvas.geometry()
+            widget = self.ui.canvas
+            while (widget := widget.parent()) is not self:
+                rect = rect.translated(widget.geometry().topLeft())
+            self._canvasrect = rect
+        return self._canvasrect
+
+    def invalidateCanvasRect(self, *args):
+        self._canvasrect = None
+
+    def eventFilter(self, watched, event):
+        if watched is self.ui.canvas and event.type() in (QEvent.Move, QEvent.Resize):
+            self.invalidateCanvasRect()
+        return super().eventFilter(watched, event)
 
     def check(self, event):
         cntr_pressed = QApplication.keyboardModifiers() == Qt.ControlModifier
         point = event.pos()
-        for elem in reversed(self.storage):
+        for elem in self.storage.itemsAt(point):
             if elem.isSelected(point):
                 if not cntr_pressed and not elem.getStatus():
                     self.storage.deact_all()
@@ -99,97 +139,294 @@ class Window(QMainWindow):
             self.active_figure_class = shape
             self.active_figure_class.set_is_current(True)
 
+    def staticLayer(self) -> QPixmap:
+        ratio = self.devicePixelRatioF()
+        size = self.size() * ratio
+        if (self._static_layer is None or self._static_layer.size() != size
+                or self._static_revision != self.storage.staticRevision):
+            self._static_layer = QPixmap(size)
+            self._static_layer.setDevicePixelRatio(ratio)
+            self._static_layer.fill(Qt.transparent)
+            painter = QPainter(self._static_layer)
+            painter.setRenderHint(QPainter.Antialiasing)
+            self._renderer.paint(painter, (shape for shape in self.storage if not shape.getStatus()))
+            painter.end()
+            self._static_revision = self.storage.staticRevision
+        return self._static_layer
+
+    @instrumentation.timed('Window.paintEvent', 'paint')
     def paintEvent(self, event):
         super().paintEvent(event)
+        exposed = event.rect()
+        layer = self.staticLayer()
+        ratio = layer.devicePixelRatioF()
         painter = QPainter(self)
+        painter.drawPixmap(QRectF(exposed), layer, QRectF(
+            exposed.x() * ratio, exposed.y() * ratio, exposed.width() * ratio, exposed.height() * ratio
+        ))
         painter.setRenderHint(QPainter.Antialiasing)
-        for shapes in self.storage:
-            shapes.paint(painter)
+        self._renderer.paint(painter, self.storage.getActiveItems(), exposed)
+        if self._overlay and self.overlayRect().intersects(exposed):
+            self.paintOverlay(painter)
+
+    def overlayRect(self) -> QRect:
+        width, height = self.OVERLAY_SIZE
+        canvas = self.canvasrect
+        return QRect(canvas.right() - width - 6, canvas.top() + 6, width, height)
+
+    def paintOverlay(self, painter) -> None:
+        calls = instrumentation.counter('notifyObservers')
+        fan_out = instrumentation.counter('observerFanOut') / calls if calls else 0.0
+        rect = self.overlayRect()
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing, False)
+        painter.fillRect(rect, QColor(0, 0, 0, 160))
+        painter.setPen(QColor(Qt.white))
+        painter.drawText(rect.adjusted(6, 4, -6, -4), Qt.AlignLeft | Qt.AlignVCenter,
+                         f"frame {instrumentation.last('Window.paintEvent') * 1000:.1f} ms\n"
+                         f"{instrumentation.rate('input'):.0f} events/s\n"
+                         f"notify {calls} (fan-out {fan_out:.1f})")
+        painter.restore()
 
-    def update(self) -> None:
-        super().update()
+    def toggleOverlay(self) -> None:
+        self._overlay = not self._overlay
+        instrumentation.enabled = self._overlay or self._profiling
+        if self._overlay:
+            self._overlay_timer.start(self.OVERLAY_REFRESH_MS)
+        else:
+            self._overlay_timer.stop()
+        super().update(self.overlayRect())
+
+    def exportProfile(self) -> None:
+        filename, selected_filter = QFileDialog.getSaveFileName(self, 'Экспорт профиля', filter=PROFILE_FILTERS)
+        if filename:
+            if selected_filter.startswith('Chrome'):
+                instrumentation.exportChromeTrace(filename)
+            else:
+                instrumentation.exportJson(filename)
+
+    def update(self, *args) -> None:
+        if args:
+            super().update(*args)
+            return
+        damage = self.storage.takeDamage()
+        if damage is None:
+            super().update()
+        elif not damage.isEmpty():
+            super().update(damage)
+        if self._overlay:
+            super().update(self.overlayRect())
         self.ui.treeView.update()
-        self.ui.groupButton.setEnabled(sum(1 for _ in self.storage.getActiveItems()) > 1)
+        self.ui.groupButton.setEnabled(self.storage.selectedCount() > 1)
 
     def mouseReleaseEvent(self, event):
         self.mouse_pos = None
+        self.storage.history.seal()
 
+    @instrumentation.timed('Window.mousePressEvent', 'input')
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton:
-            self.check(event)
+            with self.storage.batch():
+                self.check(event)
+        # every drag becomes its own undo step
+        self.storage.history.seal()
         self.mouse_pos = event.pos()
         self.update()
 
+    @instrumentation.timed('Window.mouseMoveEvent', 'input')
     def mouseMoveEvent(self, event):
         if self.mouse_pos is not None:
             diff = event.pos() - self.mouse_pos
-            for elem in self.storage.getActiveItems():
-                elem.move_inplace(self.canvasrect, diff.x(), diff.y())
+            self.storage.moveSelected(self.canvasrect, diff.x(), diff.y())
             self.mouse_pos = event.pos()
             self.update()
 
+    @instrumentation.timed('Window.wheelEvent', 'input')
     def wheelEvent(self, event):
-        for shape in self.storage.getActiveItems():
-            shape.change_size(self.canvasrect, event.angleDelta().y() // 120)
+        self.storage.resizeSelected(self.canvasrect, event.angleDelta().y() // 120)
         self.update()
 
+    @instrumentation.timed('Window.keyPressEvent', 'input')
     def keyPressEvent(self, event):
-        if event.key() == Qt.Key_Delete:
-            self.storage.deleteAllActive()
-        elif event.key() in self.MOVE_KEYS:
-            dx, dy = [
-                (0, -self.STEP_MOVE),  # Qt.Key_W
-                (-self.STEP_MOVE, 0),  # Qt.Key_A
-                (0, self.STEP_MOVE),  # Qt.Key_S
-                (self.STEP_MOVE, 0)  # Qt.Key_D
-            ][self.MOVE_KEYS.index(event.key())]
-            for shape in self.storage.getActiveItems():
-                shape.move_inplace(self.canvasrect, dx, dy)
-        elif event.key() in self.CHANGE_SIZE_KEYS:
-            dsize = [STEP_CHANGE_SIZE, -STEP_CHANGE_SIZE][self.CHANGE_SIZE_KEYS.index(event.key())]
-            for shape in self.storage.getActiveItems():
-                shape.change_size(self.canvasrect, dsize)
+        if event.key() == Qt.Key_F3:
+            self.toggleOverlay()
+            return
+        if event.key() == Qt.Key_F4:
+            self.exportProfile()
+            return
+        if event.matches(QKeySequence.Undo):
+            self.undo()
+            return
+        if event.matches(QKeySequence.Redo) or (event.key() == Qt.Key_Y and event.modifiers() == Qt.ControlModifier):
+            self.redo()
+            return
+        with self.storage.batch():
+            if event.key() == Qt.Key_Delete:
+                self.storage.deleteAllActive()
+            elif event.key() in self.MOVE_KEYS:
+                dx, dy = [
+                    (0, -self.STEP_MOVE),  # Qt.Key_W
+                    (-self.STEP_MOVE, 0),  # Qt.Key_A
+                    (0, self.STEP_MOVE),  # Qt.Key_S
+                    (self.STEP_MOVE, 0)  # Qt.Key_D
+                ][self.MOVE_KEYS.index(event.key())]
+                self.storage.moveSelected(self.canvasrect, dx, dy)
+            elif event.key() in self.CHANGE_SIZE_KEYS:
+                dsize = [STEP_CHANGE_SIZE, -STEP_CHANGE_SIZE][self.CHANGE_SIZE_KEYS.index(event.key())]
+                self.storage.resizeSelected(self.canvasrect, dsize)
+        self.storage.history.seal()
         self.update()
 
+    def undo(self):
+        if self.storage.undo():
+            self.update()
+
+    def redo(self):
+        if self.storage.redo():
+            self.update()
+
     def groupElements(self):
-        group = Group()
-        for elem in self.storage:
-            if elem.getStatus():
-                group.addChild(elem)
-        self.storage.deleteAllActive()
-        self.storage.addItem(group)
+        self.storage.groupAllActive()
         self.update()
 
+    def _progressDialog(self, text, title, task, modality) -> QProgressDialog:
+        progress = QProgressDialog(text, 'Отмена', 0, 100, self)
+        progress.setWindowTitle(title)
+        progress.setWindowModality(modality)
+        progress.setMinimumDuration(500)
+        progress.canceled.connect(task.cancel)
+        task.signals.progress.connect(lambda done: progress.setValue(int(done * 100)))
+        return progress
+
+    def _startTask(self, task, progress, on_finished, on_failed):
+        def finish(handler, result):
+            progress.reset()
+            progress.deleteLater()
+            self._tasks.discard(task)
+            handler(result)
+
+        task.signals.finished.connect(lambda result: finish(on_finished, result))
+        task.signals.failed.connect(lambda error: finish(on_failed, error))
+        self._tasks.add(task)
+        task.start()
+
     def saveToFile(self):
-        filename, _ = QFileDialog.getSaveFileName(self, 'Сохранение фигур', filter='*.xml')
+        filename, selected_filter = QFileDialog.getSaveFileName(self, 'Сохранение фигур', filter=FILE_FILTERS)
         if filename:
-            msg = QMessageBox(self)
-            msg.setWindowTitle("Сохранение файла")
-            try:
-                self.storage.save(filename)
-            except BaseException as e:
-                logger.error("Ошибка сохранения файла", e)
-                msg.setText("Ошибка сохранения")
-                msg.setIcon(QMessageBox.Critical)
-            else:
-                msg.setText(f"Файл '{filename}' успешно сохранен")
-            finally:
-                msg.exec_()
+            if not filename.lower().endswith(('.xml', '.shb')):
+                filename += '.shb' if 'shb' in selected_filter else '.xml'
+            self._queueWrite(filename, lambda: self._startSave(filename))
+
+    def _startSave(self, filename):
+        journal = self.storage.journal
+        token = journal.checkpoint()
+        task = BackgroundTask(save_task, self.storage.snapshot(), filename)
+        progress = self._progressDialog('Сохранение фигур...', "Сохранение файла", task, Qt.NonModal)
+        self._startTask(task, progress,
+                        lambda saved: self._saveFinished(journal, filename, token, saved),
+                        lambda error: self._saveFinished(journal, filename, token, False, error))
+
+    def _queueWrite(self, filename, start) -> None:
+        # writes of one file run one after another, a later snapshot must not be replaced by an older one
+        if filename in self._writing:
+            self._writing[filename].append(start)
+        else:
+            self._writing[filename] = []
+            start()
+
+    def _writeFinished(self, filename) -> None:
+        waiting = self._writing.get(filename)
+        if waiting:
+            waiting.pop(0)()
+        else:
+            self._writing.pop(filename, None)
+
+    def _saveFinished(self, journal, filename, token, saved, error=None):
+        self._journalSaved(journal, filename, token, saved)
+        self._writeFinished(filename)
+        msg = QMessageBox(self)
+        msg.setWindowTitle("Сохранение файла")
+        if error is not None:
+            logger.error("Ошибка сохранения файла: %s", error)
+            msg.setText("Ошибка сохранения")
+            msg.setIcon(QMessageBox.Critical)
+        elif saved:
+            msg.setText(f"Файл '{filename}' успешно сохранен")
+        else:
+            msg.setText("Сохранение отменено")
+        msg.exec_()
+
+    def _journalSaved(self, journal, filename, token, saved) -> None:
+        # tokens are only unique within one journal, and another document may have been opened since
+        if saved and journal is self.storage.journal:
+            journal.rebase(filename, token)
+        else:
+            journal.cancel(token)
+
+    def compactJournal(self) -> None:
+        # folds the journal back into a full save of the document, without any dialog
+        journal = self.storage.journal
+        filename = journal.document
+        # a save of the document is already on its way, the next tick will see what is left
+        if filename is None or filename in self._writing or not journal.pending:
+            return
+        self._writing[filename] = []
+        token = journal.checkpoint()
+        task = BackgroundTask(save_task, self.storage.snapshot(), filename)
+
+        def finish(saved, error=None):
+            self._tasks.discard(task)
+            if error is not None:
+                logger.error("Ошибка автосохранения: %s", error)
+            self._journalSaved(journal, filename, token, saved)
+            self._writeFinished(filename)
+
+        task.signals.finished.connect(finish)
+        task.signals.failed.connect(lambda error: finish(False, error))
+        # the pool does not own the task, it must stay referenced until it has finished
+        self._tasks.add(task)
+        task.start()
 
     def loadFromFile(self):
-        filename, _ = QFileDialog.getOpenFileName(self, 'Сохранение фигур', filter='*.xml')
+        filename, _ = QFileDialog.getOpenFileName(self, 'Сохранение фигур', filter=FILE_FILTERS)
         if filename:
-            try:
-                self.storage.load(filename)
-                self.update()
-            except BaseException as e:
-                msg = QMessageBox(self)
-                msg.setWindowTitle("открытие файла")
-                logger.error("Ошибка открытия файла", e)
-                msg.setText("Ошибка открытия файла")
-                msg.setIcon(QMessageBox.Critical)
-                msg.exec_()
+            self.openFile(filename)
+
+    def openFile(self, filename):
+        self.storage.journal = Journal()
+        self.storage.clear()
+        self.update()
+        task = BackgroundTask(load_task, filename)
+        task.signals.chunk.connect(lambda chunk: self._loadChunk(task, chunk))
+        progress = self._progressDialog('Загрузка фигур...', "Открытие файла", task, Qt.WindowModal)
+        self._startTask(task, progress, lambda loaded: self._loadFinished(filename, loaded), self._loadFailed)
+
+    def _loadFinished(self, filename, loaded):
+        if not loaded:
+            return
+        # changes that never made it into a full save
+        lines = Journal.recover(self.storage, filename)
+        if lines:
+            logger.info("Восстановлено изменений из журнала: %d", len(lines))
+        self.storage.journal = Journal(filename, lines)
+        self.update()
+
+    def _loadChunk(self, task, chunk):
+        if not task.isCancelled():
+            self.storage.addSnapshots(chunk)
+            self.update()
 
+    def closeEvent(self, event):
+        self.storage.journal.close()
+        super().closeEvent(event)
+
+    def _loadFailed(self, error):
+        msg = QMessageBox(self)
+        msg.setWindowTitle("открытие файла")
+        logger.error("Ошибка открытия файла: %s", error)
+        msg.setText("Ошибка открытия файла")
+        msg.setIcon(QMessageBox.Critical)
+        msg.exec_()
 
 def my_excepthook(type, value, tback):
     QtWidgets.QMessageBox.critical(
@@ -201,10 +438,18 @@ def my_excepthook(type, value, tback):
 
 sys.excepthook = my_excepthook
 
+
+def launch(argv) -> Window:
+    window = Window()
+    window.show()
+    if argv:
+        # the first frame goes out before the document starts loading in the background
+        QTimer.singleShot(0, lambda: window.openFile(argv[0]))
+    return window
+
+
 if __name__ == "__main__":
-    logger = logging.getLogger(__name__)
     logger.setLevel(logging.INFO)
     App = QApplication(sys.argv)
-    window = Window()
-    window.show()
+    window = launch(sys.argv[1:])
     sys.exit(App.exec())
@@ -0,0 +1,56 @@
+import threading
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from .instrumentation import instrumentation
+from .storage import Storage
+
+
+class TaskSignals(QObject):
+    progress = pyqtSignal(float)
+    chunk = pyqtSignal(object)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(object)
+
+
+### WORKER TASK ###
+class BackgroundTask(QRunnable):
+    def __init__(self, function, *args, **kwargs):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.signals = TaskSignals()
+        self._function = function
+        self._args = args
+        self._kwargs = kwargs
+        self._cancelled = threading.Event()
+
+    def start(self) -> None:
+        QThreadPool.globalInstance().start(self)
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def isCancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def run(self) -> None:
+        try:
+            result = self._function(*self._args, task=self, **self._kwargs)
+        except BaseException as e:
+            self.signals.failed.emit(e)
+        else:
+            self.signals.finished.emit(result)
+
+
+def save_task(snapshot, filename, task):
+    return Storage.saveSnapshot(snapshot, filename, task.signals.progress.emit, task.isCancelled)
+
+
+@instrumentation.timed('load_task', 'io')
+def load_task(filename, task):
+    for chunk, done in Storage.iterLoad(filename):
+        if task.isCancelled():
+            return False
+        task.signals.chunk.emit(chunk)
+        task.signals.progress.emit(done)
+    return True
@@ -0,0 +1,92 @@
+import mmap
+import struct
+from operator import itemgetter
+from typing import Generator
+
+from .snapshot import ShapeSnapshot
+
+EXTENSION = '.shb'
+MAGIC = b'SHPB'
+VERSION = 1
+# magic, version, record count
+HEADER = struct.Struct('<4sHI')
+# type, id, left, top, width, height, rgba, parent record (-1 for top level)
+RECORD = struct.Struct('<BIiiiiIi')
+SHAPE_TYPES = ('Circle', 'Rectangle', 'Triangle', 'Group')
+GROUP_TYPE = SHAPE_TYPES.index('Group')
+NO_PARENT = -1
+# RECORD as a packed numpy record, for unpacking the whole table at once
+RECORD_FIELDS = (('kind', '<u1'), ('id', '<u4'), ('left', '<i4'), ('top', '<i4'),
+                 ('width', '<i4'), ('height', '<i4'), ('rgba', '<u4'), ('parent', '<i4'))
+
+
+def is_binary(filename: str) -> bool:
+    return filename.lower().endswith(EXTENSION)
+
+
+def _pack(snapshot: ShapeSnapshot, records: list, parent: int) -> None:
+    index = len(records)
+    records.append(RECORD.pack(SHAPE_TYPES.index(snapshot.tag), snapshot.id, *snapshot.rect, snapshot.color, parent))
+    for child in snapshot.children or ():
+        _pack(child, records, index)
+
+
+def save(snapshots, filename: str, progress=None, cancelled=None, chunk_size: int = 1000) -> bool:
+    records = []
+    total = len(snapshots) or 1
+    for i, snapshot in enumerate(snapshots, 1):
+        if cancelled is not None and cancelled():
+            return False
+        _pack(snapshot, records, NO_PARENT)
+        if progress is not None and not i % chunk_size:
+            progress(i / total)
+    with open(filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(records)))
+        f.write(b''.join(records))
+    return True
+
+
+def _unpackColumns(data, count: int) -> tuple:
+    # kinds, ids, rects, colors and parents as lists of plain ints, copied out so the buffer can be closed
+    try:
+        import numpy
+    except ImportError:
+        with memoryview(data) as view:
+            records = list(RECORD.iter_unpack(view[HEADER.size:HEADER.size + count * RECORD.size]))
+        return tuple(list(map(itemgetter(field), records)) for field in (0, 1, slice(2, 6), 6, 7))
+    records = numpy.frombuffer(data, numpy.dtype(list(RECORD_FIELDS)), count, HEADER.size)
+    rects = list(zip(*(records[field].tolist() for field in ('left', 'top', 'width', 'height'))))
+    return records['kind'].tolist(), records['id'].tolist(), rects, records['rgba'].tolist(), records['parent'].tolist()
+
+
+def load(filename: str) -> list:
+    top_level = []
+    children = {}
+    with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        magic, version, count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"'{filename}' is not a binary shapes file")
+        if HEADER.size + count * RECORD.size > len(data):
+            raise ValueError(f"'{filename}' is truncated")
+        kinds, ids, rects, colors, parents = _unpackColumns(data, count)
+    tags = [SHAPE_TYPES[kind] for kind in kinds]
+    empty = [() if kind == GROUP_TYPE else None for kind in kinds]
+    snapshots = list(map(ShapeSnapshot._make, zip(tags, ids, rects, colors, empty)))
+    for index, parent in enumerate(parents):
+        if parent == NO_PARENT:
+            top_level.append(index)
+        else:
+            children.setdefault(parent, []).append(index)
+    # pre-order records: nested groups always come after their parent
+    for parent in sorted(children, reverse=True):
+        snapshots[parent] = snapshots[parent]._replace(children=tuple(snapshots[i] for i in children[parent]))
+    return [snapshots[i] for i in top_level]
+
+
+def iterLoad(filename: str, chunk_size: int) -> Generator[tuple, None, None]:
+    items = load(filename)
+    total = len(items) or 1
+    for start in range(0, len(items), chunk_size):
+        yield items[start:start + chunk_size], min(start + chunk_size, total) / total
+    if not items:
+        yield [], 1.0
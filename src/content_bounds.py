@@ -0,0 +1,85 @@
+import heapq
+from itertools import count
+
+from PyQt5.QtCore import QPoint, QRect
+
+REBUILD_FACTOR = 4
+REBUILD_SLACK = 64
+
+
+### CONTENT BOUNDS ###
+class ContentBounds:
+    # lazy heaps: every change pushes fresh entries, stale ones are dropped when they reach the top
+    EDGES = (
+        ('left', lambda rect: rect.left()),
+        ('top', lambda rect: rect.top()),
+        ('right', lambda rect: -rect.right()),
+        ('bottom', lambda rect: -rect.bottom()),
+    )
+
+    def __init__(self):
+        self._heaps = {name: [] for name, _ in self.EDGES}
+        self._versions = {}
+        self._counter = count()
+        self._cached = QRect()
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._versions)
+
+    def _push(self, item) -> None:
+        version = next(self._counter)
+        self._versions[item] = version
+        rect = item.rect
+        for name, key in self.EDGES:
+            heapq.heappush(self._heaps[name], (key(rect), version, item))
+
+    def add(self, item) -> None:
+        self._push(item)
+        self._cached = item.rect if not self._cached.isValid() else self._cached.united(item.rect)
+
+    def update(self, item) -> None:
+        if item in self._versions:
+            self._push(item)
+            self._dirty = True
+            if len(self._heaps['left']) > REBUILD_FACTOR * len(self._versions) + REBUILD_SLACK:
+                self._rebuild()
+
+    def remove(self, item) -> None:
+        if self._versions.pop(item, None) is not None:
+            self._dirty = True
+
+    def clear(self) -> None:
+        for heap in self._heaps.values():
+            heap.clear()
+        self._versions.clear()
+        self._cached = QRect()
+        self._dirty = False
+
+    def _rebuild(self) -> None:
+        items = list(self._versions)
+        for heap in self._heaps.values():
+            heap.clear()
+        for item in items:
+            version = self._versions[item]
+            rect = item.rect
+            for name, key in self.EDGES:
+                self._heaps[name].append((key(rect), version, item))
+        for heap in self._heaps.values():
+            heapq.heapify(heap)
+
+    def _top(self, name) -> int:
+        heap = self._heaps[name]
+        while heap and self._versions.get(heap[0][2]) != heap[0][1]:
+            heapq.heappop(heap)
+        return heap[0][0]
+
+    def bounds(self) -> QRect:
+        if self._dirty:
+            self._dirty = False
+            if self._versions:
+                self._cached = QRect(QPoint(self._top('left'), self._top('top')),
+                                     QPoint(-self._top('right'), -self._top('bottom')))
+            else:
+                self._cached = QRect()
+        return self._cached
@@ -0,0 +1,212 @@
+from abc import ABCMeta, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+
+# rough per-entry sizes used for the memory cap, in bytes
+COMMAND_COST = 128
+REF_COST = 8
+# a removed shape stays alive only through the history
+SHAPE_COST = 512
+HISTORY_LIMIT = 32 * 1024 * 1024
+
+
+### COMMANDS ###
+class Command(metaclass=ABCMeta):
+    def cost(self) -> int:
+        return COMMAND_COST
+
+    def merge(self, other) -> bool:
+        return False
+
+    @abstractmethod
+    def undo(self, storage) -> None:
+        pass
+
+    @abstractmethod
+    def redo(self, storage) -> None:
+        pass
+
+
+class MoveCommand(Command):
+    def __init__(self, items, dx, dy):
+        self.items = tuple(items)
+        self.dx = dx
+        self.dy = dy
+
+    def cost(self) -> int:
+        return COMMAND_COST + REF_COST * len(self.items)
+
+    def merge(self, other) -> bool:
+        if not isinstance(other, MoveCommand) or other.items != self.items:
+            return False
+        self.dx += other.dx
+        self.dy += other.dy
+        return True
+
+    def undo(self, storage) -> None:
+        for item in self.items:
+            item.translate(-self.dx, -self.dy)
+
+    def redo(self, storage) -> None:
+        for item in self.items:
+            item.translate(self.dx, self.dy)
+
+
+class ResizeCommand(Command):
+    def __init__(self, items, dsize):
+        self.items = tuple(items)
+        self.dsize = dsize
+
+    def cost(self) -> int:
+        return COMMAND_COST + REF_COST * len(self.items)
+
+    # margins add up, so growing by -dsize exactly undoes growing by dsize
+    def undo(self, storage) -> None:
+        for item in self.items:
+            item.resize(-self.dsize)
+
+    def redo(self, storage) -> None:
+        for item in self.items:
+            item.resize(self.dsize)
+
+
+class RecolorCommand(Command):
+    def __init__(self, items, old_colors, color):
+        self.items = tuple(items)
+        self.old_colors = tuple(old_colors)
+        self.color = color
+
+    def cost(self) -> int:
+        return COMMAND_COST + 2 * REF_COST * len(self.items)
+
+    def undo(self, storage) -> None:
+        for item, color in zip(self.items, self.old_colors):
+            item.color = color
+
+    def redo(self, storage) -> None:
+        for item in self.items:
+            item.color = self.color
+
+
+class AddCommand(Command):
+    def __init__(self, items):
+        self.items = list(items)
+
+    def cost(self) -> int:
+        return COMMAND_COST + SHAPE_COST * len(self.items)
+
+    def undo(self, storage) -> None:
+        storage._removeItems(self.items)
+
+    def redo(self, storage) -> None:
+        storage.addItems(self.items)
+
+
+class DeleteCommand(Command):
+    # placed is a list of (row, item) in ascending row order, as the rows were before the deletion
+    def __init__(self, placed):
+        self.placed = placed
+
+    def cost(self) -> int:
+        return COMMAND_COST + (SHAPE_COST + REF_COST) * len(self.placed)
+
+    def undo(self, storage) -> None:
+        storage._restoreItems(self.placed)
+
+    def redo(self, storage) -> None:
+        storage._removeItems([item for _, item in self.placed])
+
+
+class GroupCommand(Command):
+    def __init__(self, group, placed):
+        self.group = group
+        self.placed = placed
+
+    def cost(self) -> int:
+        return COMMAND_COST + SHAPE_COST + 2 * REF_COST * len(self.placed)
+
+    def undo(self, storage) -> None:
+        storage._removeItems([self.group])
+        self.group.takeChildren()
+        storage._restoreItems(self.placed)
+
+    def redo(self, storage) -> None:
+        storage._groupItems({item for _, item in self.placed}, self.group)
+
+
+### HISTORY ###
+class History:
+    # Entries hold shape references and deltas, never copies of the scene. Moves coalesce into the
+    # previous entry until the history is sealed, so a drag undoes as a whole.
+    def __init__(self, limit: int = HISTORY_LIMIT):
+        self.limit = limit
+        self._undo = deque()
+        self._redo = []
+        self._cost = 0
+        self._sealed = True
+        self._suspended = 0
+
+    def __len__(self) -> int:
+        return len(self._undo)
+
+    @property
+    def cost(self) -> int:
+        return self._cost
+
+    @property
+    def recording(self) -> bool:
+        return not self._suspended
+
+    @contextmanager
+    def suspended(self):
+        self._suspended += 1
+        try:
+            yield
+        finally:
+            self._suspended -= 1
+
+    def seal(self) -> None:
+        self._sealed = True
+
+    def record(self, command: Command) -> None:
+        if self._suspended:
+            return
+        for dropped in self._redo:
+            self._cost -= dropped.cost()
+        self._redo.clear()
+        if not self._sealed and self._undo:
+            last = self._undo[-1]
+            before = last.cost()
+            if last.merge(command):
+                self._cost += last.cost() - before
+                return
+        self._sealed = False
+        self._undo.append(command)
+        self._cost += command.cost()
+        self._evict()
+
+    def _evict(self) -> None:
+        while self._cost > self.limit and len(self._undo) > 1:
+            self._cost -= self._undo.popleft().cost()
+
+    def takeUndo(self) -> Command:
+        self._sealed = True
+        if not self._undo:
+            return None
+        command = self._undo.pop()
+        self._redo.append(command)
+        return command
+
+    def takeRedo(self) -> Command:
+        self._sealed = True
+        if not self._redo:
+            return None
+        command = self._redo.pop()
+        self._undo.append(command)
+        return command
+
+    def clear(self) -> None:
+        self._undo.clear()
+        self._redo.clear()
+        self._cost = 0
+        self._sealed = True
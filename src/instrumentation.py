@@ -0,0 +1,118 @@
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from functools import wraps
+
+MAX_SPANS = 100000
+RATE_WINDOW = 1.0
+
+
+### INSTRUMENTATION ###
+class Instrumentation:
+    def __init__(self, max_spans: int = MAX_SPANS):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._spans = deque(maxlen=max_spans)
+        self._stats = {}
+        self._counters = Counter()
+        self._recent = {}
+
+    def timed(self, name: str, category: str = 'function'):
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.record(name, category, start, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def record(self, name: str, category: str, start: float, duration: float) -> None:
+        end = start + duration
+        with self._lock:
+            self._spans.append((name, category, start, duration, threading.get_ident()))
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = [0, 0.0, 0.0, 0.0]
+            stats[0] += 1
+            stats[1] += duration
+            stats[2] = max(stats[2], duration)
+            stats[3] = duration
+            recent = self._recent.setdefault(category, deque())
+            recent.append(end)
+            while recent[0] < end - RATE_WINDOW:
+                recent.popleft()
+
+    def count(self, name: str, value: int = 1) -> None:
+        self._counters[name] += value
+
+    def last(self, name: str) -> float:
+        stats = self._stats.get(name)
+        return stats[3] if stats else 0.0
+
+    def rate(self, category: str) -> float:
+        with self._lock:
+            recent = self._recent.get(category)
+            if not recent:
+                return 0.0
+            now = time.perf_counter()
+            while recent and recent[0] < now - RATE_WINDOW:
+                recent.popleft()
+            return len(recent) / RATE_WINDOW
+
+    def counter(self, name: str) -> int:
+        return self._counters[name]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._spans.clear()
+            self._stats.clear()
+            self._counters.clear()
+            self._recent.clear()
+            self._origin = time.perf_counter()
+
+    def report(self) -> dict:
+        with self._lock:
+            stats = {
+                name: {'count': count, 'total': total, 'mean': total / count, 'max': longest}
+                for name, (count, total, longest, _) in self._stats.items()
+            }
+        calls = self._counters['notifyObservers']
+        return {
+            'timers': stats,
+            'counters': dict(self._counters),
+            'mean_fan_out': self._counters['observerFanOut'] / calls if calls else 0.0,
+            'spans': len(self._spans),
+        }
+
+    def chromeTrace(self) -> dict:
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self._spans)
+        events = [{
+            'name': name, 'cat': category, 'ph': 'X', 'pid': pid, 'tid': thread,
+            'ts': (start - self._origin) * 1e6, 'dur': duration * 1e6,
+        } for name, category, start, duration, thread in spans]
+        end = max((event['ts'] + event['dur'] for event in events), default=0.0)
+        events.extend({'name': name, 'ph': 'C', 'pid': pid, 'tid': 0, 'ts': end, 'args': {name: value}}
+                      for name, value in self._counters.items())
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def exportJson(self, filename: str) -> None:
+        with open(filename, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def exportChromeTrace(self, filename: str) -> None:
+        with open(filename, 'w') as f:
+            json.dump(self.chromeTrace(), f)
+
+
+instrumentation = Instrumentation()
+instrumentation.enabled = os.environ.get('SHAPES_PROFILE') == '1'
@@ -0,0 +1,271 @@
+import json
+import logging
+import os
+from itertools import count
+
+from PyQt5.QtGui import QColor
+
+from .history import AddCommand, DeleteCommand, GroupCommand, MoveCommand, RecolorCommand, ResizeCommand
+from .shapes import Shape, Group
+from .snapshot import ShapeSnapshot
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_SUFFIX = '.journal'
+JOURNAL_VERSION = 1
+CHECKPOINT = '{"op":"checkpoint"}\n'
+
+
+def journal_path(document: str) -> str:
+    return document + JOURNAL_SUFFIX
+
+
+def fingerprint(filename: str):
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+### RECORDS ###
+def shape_key(item) -> list:
+    return [item.__class__.__name__, item._id]
+
+
+def encode_snapshot(snapshot: ShapeSnapshot) -> list:
+    children = None if snapshot.children is None else [encode_snapshot(child) for child in snapshot.children]
+    return [snapshot.tag, snapshot.id, list(snapshot.rect), snapshot.color, children]
+
+
+def decode_snapshot(data) -> ShapeSnapshot:
+    tag, _id, rect, color, children = data
+    if children is not None:
+        children = tuple(decode_snapshot(child) for child in children)
+    return ShapeSnapshot(tag, _id, tuple(rect), color, children)
+
+
+def encode(command, undo: bool = False) -> dict:
+    if isinstance(command, MoveCommand):
+        record = {'op': 'move', 'keys': [shape_key(item) for item in command.items],
+                  'dx': command.dx, 'dy': command.dy}
+    elif isinstance(command, ResizeCommand):
+        record = {'op': 'resize', 'keys': [shape_key(item) for item in command.items], 'dsize': command.dsize}
+    elif isinstance(command, RecolorCommand):
+        record = {'op': 'color', 'keys': [shape_key(item) for item in command.items],
+                  'old': [color.rgba() for color in command.old_colors], 'color': command.color.rgba()}
+    elif isinstance(command, AddCommand):
+        # shapes that come back need their full state, shapes that go away only their key
+        record = {'op': 'add'}
+        if undo:
+            record['keys'] = [shape_key(item) for item in command.items]
+        else:
+            record['shapes'] = [encode_snapshot(item.snapshot()) for item in command.items]
+    elif isinstance(command, DeleteCommand):
+        record = {'op': 'delete', 'rows': [row for row, _ in command.placed]}
+        if undo:
+            record['shapes'] = [encode_snapshot(item.snapshot()) for _, item in command.placed]
+        else:
+            record['keys'] = [shape_key(item) for _, item in command.placed]
+    elif isinstance(command, GroupCommand):
+        record = {'op': 'group', 'group': encode_snapshot(Shape.snapshot(command.group)),
+                  'rows': [row for row, _ in command.placed],
+                  'keys': [shape_key(item) for _, item in command.placed]}
+    else:
+        raise TypeError(f'cannot journal {command.__class__.__name__}')
+    if undo:
+        record['undo'] = True
+    return record
+
+
+class _Scene:
+    # every shape the replay has seen, by (class name, id)
+    def __init__(self, storage):
+        self._shapes = {}
+        for item in storage:
+            self.add(item)
+
+    def add(self, item) -> None:
+        self._shapes[item.__class__.__name__, item._id] = item
+        if isinstance(item, Group):
+            for child in item:
+                self.add(child)
+
+    def get(self, key):
+        return self._shapes[tuple(key)]
+
+    def find(self, key):
+        return self._shapes.get(tuple(key))
+
+    def create(self, data):
+        shape = Shape.fromSnapshot(decode_snapshot(data))
+        self.add(shape)
+        return shape
+
+    def items(self, record) -> list:
+        if 'shapes' in record:
+            return [self.create(data) for data in record['shapes']]
+        return [self.get(key) for key in record['keys']]
+
+
+def decode(record: dict, scene: _Scene):
+    op = record['op']
+    if op == 'move':
+        return MoveCommand(scene.items(record), record['dx'], record['dy'])
+    if op == 'resize':
+        return ResizeCommand(scene.items(record), record['dsize'])
+    if op == 'color':
+        return RecolorCommand(scene.items(record), map(QColor.fromRgba, record['old']),
+                              QColor.fromRgba(record['color']))
+    if op == 'add':
+        return AddCommand(scene.items(record))
+    if op == 'delete':
+        return DeleteCommand(list(zip(record['rows'], scene.items(record))))
+    if op == 'group':
+        group = scene.find(record['group'][:2]) or scene.create(record['group'])
+        return GroupCommand(group, list(zip(record['rows'], scene.items(record))))
+    raise ValueError(f"unknown journal record '{op}'")
+
+
+### JOURNAL ###
+class Journal:
+    # Append-only log of the edits made since the document was last fully saved, one JSON record
+    # per line after a header naming the save it applies to. Saves write a checkpoint line before
+    # taking their snapshot and, once the file is replaced, start a new journal holding only what
+    # came after it. Without a document nothing is written, but lines after a pending checkpoint
+    # are still kept so the first save can carry them over.
+    def __init__(self, document: str = None, lines=()):
+        self.document = None
+        self._file = None
+        self._tail = None
+        self._dirty = False
+        self._records = 0
+        self._captures = {}
+        self._tokens = count(1)
+        if document is not None:
+            self.open(document, lines)
+
+    @property
+    def path(self) -> str:
+        return journal_path(self.document) if self.document is not None else None
+
+    @property
+    def pending(self) -> int:
+        return self._records + (self._tail is not None)
+
+    def open(self, document: str, lines=()) -> None:
+        self.close()
+        path = journal_path(document)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(json.dumps({'journal': JOURNAL_VERSION, 'base': fingerprint(document)}) + '\n')
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        self.document = document
+        self._file = open(path, 'a')
+        self._records = sum(line != CHECKPOINT for line in lines)
+
+    def append(self, command, undo: bool = False) -> None:
+        if self._file is None and not self._captures:
+            return
+        record = encode(command, undo)
+        tail = self._tail
+        # a drag arrives as many small moves of the same shapes, keep only their sum
+        if (tail is not None and record['op'] == tail['op'] == 'move' and record.get('undo') == tail.get('undo')
+                and record['keys'] == tail['keys']):
+            tail['dx'] += record['dx']
+            tail['dy'] += record['dy']
+            return
+        self._writeTail()
+        self._tail = record
+
+    def _writeTail(self) -> None:
+        if self._tail is not None:
+            self._write(json.dumps(self._tail, separators=(',', ':')) + '\n')
+            self._records += 1
+            self._tail = None
+
+    def _write(self, line: str) -> None:
+        if self._file is not None:
+            self._file.write(line)
+            self._dirty = True
+        for lines in self._captures.values():
+            lines.append(line)
+
+    def flush(self) -> None:
+        self._writeTail()
+        if self._dirty:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._dirty = False
+
+    def checkpoint(self) -> int:
+        self._writeTail()
+        self._write(CHECKPOINT)
+        self.flush()
+        token = next(self._tokens)
+        self._captures[token] = []
+        return token
+
+    def rebase(self, document: str, token: int) -> None:
+        # the snapshot taken at the checkpoint is now in document
+        self._writeTail()
+        lines = self._captures.pop(token, None)
+        if lines is None:
+            return
+        old_path = self.path
+        self.open(document, lines)
+        if old_path is not None and old_path != self.path and os.path.exists(old_path):
+            os.remove(old_path)
+
+    def cancel(self, token: int) -> None:
+        self._captures.pop(token, None)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+            self._dirty = False
+
+    @staticmethod
+    def recover(storage, document: str) -> list:
+        # replays the journal of document on top of storage, returns the lines applied
+        try:
+            with open(journal_path(document)) as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return []
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, ValueError):
+            return []
+        lines = lines[1:]
+        if header.get('base') != fingerprint(document):
+            # the document was replaced after the last checkpoint, but before the journal was restarted
+            checkpoints = [i for i, line in enumerate(lines) if line == CHECKPOINT]
+            if not checkpoints:
+                logger.warning("journal %s does not match its document, ignoring it", journal_path(document))
+                return []
+            lines = lines[checkpoints[-1] + 1:]
+        scene = _Scene(storage)
+        applied = []
+        with storage.batch(), storage.history.suspended():
+            for line in lines:
+                if line == CHECKPOINT:
+                    continue
+                try:
+                    record = json.loads(line)
+                    command = decode(record, scene)
+                except (ValueError, KeyError, TypeError) as e:
+                    # a torn write at the end, or something the journal never saw
+                    logger.warning("journal replay stopped: %s", e)
+                    break
+                if record.get('undo'):
+                    command.undo(storage)
+                else:
+                    command.redo(storage)
+                applied.append(line if line.endswith('\n') else line + '\n')
+        return applied
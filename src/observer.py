@@ -1,27 +1,72 @@
-from weakref import WeakSet
-from uuid import uuid4
+from contextlib import contextmanager
+from weakref import WeakSet, ref
+
+from .instrumentation import instrumentation
 
 
 class Observer:
+    __slots__ = ('_observers', '__weakref__')
+    _batch_depth = 0
+    _after_batch = {}
+
     def __init__(self):
-        self._observers = WeakSet()
-        self.uuid = None
+        # nothing, a weak reference to the only observer, or a WeakSet once there are more
+        self._observers = None
 
     def addObserver(self, observer):
-        self._observers.add(observer)
+        observers = self._observers
+        if observers is None:
+            self._observers = ref(observer)
+        elif isinstance(observers, ref):
+            first = observers()
+            if first is None or first is observer:
+                self._observers = ref(observer)
+            else:
+                self._observers = WeakSet((first, observer))
+        else:
+            observers.add(observer)
 
     def removeObserver(self, observer):
-        self._observers.discard(observer)
+        observers = self._observers
+        if isinstance(observers, ref):
+            if observers() in (observer, None):
+                self._observers = None
+        elif observers is not None:
+            observers.discard(observer)
+
+    def observers(self):
+        observers = self._observers
+        if observers is None:
+            return ()
+        if isinstance(observers, ref):
+            observer = observers()
+            return () if observer is None else (observer,)
+        return observers
 
-    def notifyObservers(self, *args, **kwargs):
-        self.uuid = uuid4()
-        for observer in self._observers:
-            observer.update(self, self.uuid, *args, **kwargs)
-        self.uuid = None
+    @classmethod
+    @contextmanager
+    def batch(cls):
+        Observer._batch_depth += 1
+        try:
+            yield
+        finally:
+            Observer._batch_depth -= 1
+            if not Observer._batch_depth:
+                callbacks, Observer._after_batch = Observer._after_batch, {}
+                for callback in callbacks:
+                    callback()
 
-    def update(self, uuid, *args, **kwargs):
-        if uuid != self.uuid:
-            self._update(*args, **kwargs)
+    @staticmethod
+    def afterBatch(callback) -> bool:
+        # runs callback once when the outermost batch exits, False when there is no batch to wait for
+        if not Observer._batch_depth:
+            return False
+        Observer._after_batch[callback] = None
+        return True
 
-    def _update(self, *args, **kwargs):
-        pass
+    def notifyObservers(self, **kwargs):
+        if instrumentation.enabled:
+            instrumentation.count('notifyObservers')
+            instrumentation.count('observerFanOut', len(self.observers()))
+        for observer in self.observers():
+            observer.update(self, **kwargs)
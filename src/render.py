@@ -0,0 +1,145 @@
+from PyQt5.QtCore import QRect, Qt
+from PyQt5.QtGui import QBrush, QColor, QPainter, QPen
+
+from .shapes.shape import Shape, COLOR_BORDER, COLOR_SELECTED
+
+# longest run checked for overlaps before it is flushed anyway
+MAX_RUN = 64
+# runs of these are drawn with a single drawRects call, which fills every rect before stroking any
+OUTLINED_RUNS = ('rect', 'group')
+GROUP_PEN_COLOR = QColor(Qt.black)
+
+
+### BATCH RENDERER ###
+class BatchRenderer:
+    # Shapes are walked in paint order and consecutive ones with equal primitive and colors are collected
+    # into a run that shares one pen and brush. Rect runs go out as one drawRects call, so a rect that
+    # overlaps its run starts a new one: otherwise an earlier outline would end up on top of a later fill.
+    # Ellipses and polygons are still drawn one by one; in the raster engine a combined QPainterPath
+    # turned out slower than the individual primitives.
+    def __init__(self):
+        self._pens = {}
+        self._brushes = {}
+        self._painter = None
+        self._pen = None
+        self._brush = None
+        self._key = None
+        self._items = []
+        self._rects = []
+        self._bounds = QRect()
+
+    def pen(self, color: QColor, style=Qt.SolidLine) -> QPen:
+        key = (color.rgba(), style)
+        pen = self._pens.get(key)
+        if pen is None:
+            pen = self._pens[key] = QPen(color, 0, style)
+        return pen
+
+    def brush(self, color: QColor, style=Qt.SolidPattern) -> QBrush:
+        key = (color.rgba(), style)
+        brush = self._brushes.get(key)
+        if brush is None:
+            brush = self._brushes[key] = QBrush(color, style)
+        return brush
+
+    def paint(self, painter, shapes, exposed: QRect = None) -> None:
+        if not painter.isActive():
+            return
+        painter.save()
+        self._painter = painter
+        self._pen = self._brush = None
+        scale = Shape.deviceScale(painter)
+        try:
+            for shape in shapes:
+                self._add(shape, shape.color.rgba(), exposed, scale)
+            self._flush()
+        finally:
+            self._painter = None
+            painter.restore()
+
+    def _add(self, shape, rgba: int, exposed: QRect, scale: float) -> None:
+        rect = shape.rect
+        if exposed is not None and not rect.intersects(exposed):
+            return
+        if shape.isTiny(scale):
+            if max(rect.width(), rect.height()) * scale < 1:
+                rect = QRect(rect.center(), rect.center())
+            self._push(('tiny', rgba), rect, rect)
+        elif shape.PRIMITIVE == 'group':
+            self._push(('group', shape.color.rgba(), shape.getStatus()), rect, rect)
+            for child in shape:
+                self._add(child, rgba, exposed, scale)
+        elif shape.PRIMITIVE == 'polygon':
+            self._push(('polygon', rgba), shape._polygon, rect)
+        elif shape.PRIMITIVE in ('rect', 'ellipse'):
+            self._push((shape.PRIMITIVE, rgba), rect, rect)
+        else:
+            self._push((None, rgba), shape, rect)
+
+    def _push(self, key, item, rect: QRect) -> None:
+        if key[0] not in OUTLINED_RUNS:
+            if key != self._key:
+                self._flush()
+                self._key = key
+            self._items.append(item)
+            return
+        # antialiased outlines bleed past the rect, so touching shapes count as overlapping
+        rect = rect.adjusted(-1, -1, 1, 1)
+        if key != self._key or len(self._items) >= MAX_RUN or self._overlaps(rect):
+            self._flush()
+            self._key = key
+            self._bounds = rect
+        else:
+            self._bounds = self._bounds.united(rect)
+        self._items.append(item)
+        self._rects.append(rect)
+
+    def _overlaps(self, rect: QRect) -> bool:
+        if not rect.intersects(self._bounds):
+            return False
+        for other in self._rects:
+            if other.intersects(rect):
+                return True
+        return False
+
+    def _setState(self, pen, brush) -> None:
+        if pen is not self._pen:
+            self._painter.setPen(pen)
+            self._pen = pen
+        if brush is not self._brush:
+            self._painter.setBrush(brush)
+            self._brush = brush
+
+    def _flush(self) -> None:
+        items = self._items
+        if not items:
+            return
+        painter = self._painter
+        kind, rgba = self._key[0], self._key[1]
+        if kind == 'group':
+            active = self._key[2]
+            self._setState(self.pen(COLOR_SELECTED if active else GROUP_PEN_COLOR, Qt.DashLine),
+                           self.brush(QColor.fromRgba(rgba), Qt.Dense6Pattern if active else Qt.NoBrush))
+            painter.drawRects(items)
+        elif kind == 'tiny':
+            antialiasing = painter.testRenderHint(QPainter.Antialiasing)
+            painter.setRenderHint(QPainter.Antialiasing, False)
+            self._setState(self.pen(COLOR_BORDER, Qt.NoPen), self.brush(QColor.fromRgba(rgba)))
+            painter.drawRects(items)
+            painter.setRenderHint(QPainter.Antialiasing, antialiasing)
+        else:
+            self._setState(self.pen(COLOR_BORDER), self.brush(QColor.fromRgba(rgba)))
+            if kind == 'rect':
+                painter.drawRects(items)
+            elif kind == 'ellipse':
+                for rect in items:
+                    painter.drawEllipse(rect)
+            elif kind == 'polygon':
+                for polygon in items:
+                    painter.drawPolygon(polygon)
+            else:
+                for shape in items:
+                    shape.draw(painter)
+        self._key = None
+        self._items = []
+        self._rects = []
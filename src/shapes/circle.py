@@ -3,6 +3,9 @@ from .shape import Shape
 
 ### CLASS CIRCLE ###=====
 class Circle(Shape):
+    __slots__ = ()
+    PRIMITIVE = 'ellipse'
+
     def draw(self, painter):
         painter.drawEllipse(self._rect)
 
@@ -1,18 +1,26 @@
+import weakref
+
 from PyQt5.QtCore import QPoint, Qt, QRect
-from PyQt5.QtGui import QColor, QPen, QBrush
+from PyQt5.QtGui import QColor
 import xml.etree.ElementTree as ET
 
-from .shape import Shape, INITIAL_SIZE, COLOR_SELECTED
+from .shape import Shape, INITIAL_SIZE
+from ..snapshot import ShapeSnapshot
 
 
 ### CLASS GROUP ###
 class Group(Shape):
+    __slots__ = ('_children', '_bounds', '_bounds_dirty')
+    PRIMITIVE = 'group'
+
     def __init__(self, point=None, color=None, length=INITIAL_SIZE, activate=False, width=None, height=None, _id=None):
         if point is None:
             point = QPoint(0, 0)
         if color is None:
             color = QColor(Qt.black)
         self._children = []
+        self._bounds = QRect()
+        self._bounds_dirty = False
         super().__init__(point, color, length=length, activate=activate, width=width, height=height, _id=_id)
 
     def __len__(self) -> int:
@@ -21,21 +29,31 @@ class Group(Shape):
     def __getitem__(self, item) -> Shape:
         return self._children[item]
 
+    @property
+    def _rect(self) -> QRect:
+        if self._bounds_dirty:
+            self._updateRect()
+        return self._bounds
+
+    @_rect.setter
+    def _rect(self, rect: QRect) -> None:
+        self._bounds = rect
+        self._bounds_dirty = False
+
     def _updateRect(self) -> None:
-        self._rect = QRect()
-        if self._children:
-            self._rect = QRect(self._children[0].rect)
-            for child in self:
-                self._rect = child.rect.united(self._rect)
+        rect = QRect()
+        for child in self:
+            rect = rect.united(child.rect)
+        self._rect = rect
+
+    def _invalidateBounds(self) -> None:
+        if not self._bounds_dirty:
+            self._bounds_dirty = True
+            self._invalidateGroupBounds()
 
     def draw(self, painter) -> None:
-        brush_style = Qt.Dense6Pattern if self.getStatus() else Qt.NoBrush
-        pen_color = COLOR_SELECTED if self.getStatus() else QColor(Qt.black)
-        painter.save()
-        painter.setPen(QPen(pen_color, 0, Qt.DashLine))
-        painter.setBrush(QBrush(self.color, brush_style))
+        # groups are drawn by BatchRenderer, this only keeps them drawable with the current pen
         painter.drawRect(self._rect)
-        painter.restore()
         for elem in self:
             elem.draw(painter)
 
@@ -50,9 +68,25 @@ class Group(Shape):
             elem.deactivate()
 
     def addChild(self, child) -> None:
-        self._children.append(child)
-        self._updateRect()
-        self.notifyObservers(new_child=child)
+        self.addChildren([child])
+
+    def addChildren(self, children) -> None:
+        rect = self._rect if self._children else QRect()
+        for child in children:
+            child._group = weakref.ref(self)
+            rect = rect.united(child.rect)
+        self._children.extend(children)
+        self._rect = rect
+        self._invalidateGroupBounds()
+        self.notifyObservers(new_children=children)
+
+    def takeChildren(self) -> list:
+        children, self._children = self._children, []
+        for child in children:
+            child._group = None
+        self._rect = QRect()
+        self._invalidateGroupBounds()
+        return children
 
     def isSelected(self, point) -> bool:
         for elem in self:
@@ -60,36 +94,45 @@ class Group(Shape):
                 return True
         return False
 
-    def move_inplace(self, canvas: QRect, dx, dy) -> bool:
-        if super().move_inplace(canvas, dx, dy):
-            for elem in self:
-                elem.move_inplace(canvas, dx, dy)
-
-    def change_size(self, canvas: QRect, dsize) -> bool:
-        if super().change_size(canvas, dsize * len(self)):
-            for i, elem in enumerate(self):
-                if not elem.change_size(canvas, dsize):
-                    for j in range(i):
-                        self[j].change_size(canvas, -dsize)
-                    super().change_size(canvas, - dsize * len(self))
-                    break
-            else:
-                self._updateRect()
-                return True
-        return False
+    def _translate(self, dx, dy) -> None:
+        super()._translate(dx, dy)
+        for elem in self:
+            elem._translate(dx, dy)
 
-    def save(self) -> ET:
-        element = super().save()
-        items = ET.SubElement(element, 'items')
+    def resized_rect(self, dsize) -> QRect:
+        # children are resized in place, so the group ends up as the union of their new rects
+        rect = QRect()
+        for elem in self:
+            rect = rect.united(elem.resized_rect(dsize))
+        return rect
+
+    def can_change_size(self, dsize) -> bool:
+        return all(elem.can_change_size(dsize) for elem in self)
+
+    def _resize(self, dsize) -> None:
         for elem in self:
-            items.append(elem.save())
-        items.set('count_elements', str(len(self)))
+            elem._resize(dsize)
+        self._updateRect()
+
+    def snapshot(self) -> ShapeSnapshot:
+        return super().snapshot()._replace(children=tuple(elem.snapshot() for elem in self))
+
+    @classmethod
+    def _save(cls, snapshot: ShapeSnapshot) -> ET:
+        element = super()._save(snapshot)
+        items = ET.SubElement(element, 'items')
+        for child in snapshot.children or ():
+            items.append(Shape.saveSnapshot(child))
+        items.set('count_elements', str(len(snapshot.children or ())))
         return element
 
     @classmethod
-    def _factory_load(cls, element: ET) -> 'Group':
-        group = super()._factory_load(element)
-        items = element.find('items')
-        for item in items:
-            group.addChild(Shape.load(item))
+    def _parse(cls, element: ET) -> ShapeSnapshot:
+        children = (Shape.parse(item) for item in element.find('items'))
+        return super()._parse(element)._replace(children=tuple(child for child in children if child is not None))
+
+    @classmethod
+    def _factory_snapshot(cls, snapshot: ShapeSnapshot) -> 'Group':
+        group = super()._factory_snapshot(snapshot)
+        group.addChildren([Shape.fromSnapshot(child) for child in snapshot.children or ()])
         return group
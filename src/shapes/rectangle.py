@@ -3,6 +3,9 @@ from .shape import Shape
 
 ### CLASS RECTANGLE ###
 class Rectangle(Shape):
+    __slots__ = ()
+    PRIMITIVE = 'rect'
+
     def draw(self, painter) -> None:
         painter.drawRect(self._rect)
 
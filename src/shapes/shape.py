@@ -1,25 +1,29 @@
 from abc import ABCMeta, abstractmethod
 from PyQt5.QtCore import QRect, Qt, QMargins
-from PyQt5.QtGui import QColor, QPen, QBrush
+from PyQt5.QtGui import QColor
 import xml.etree.ElementTree as ET
 
+from ..snapshot import ShapeSnapshot
 from ..storage_object import StorageObject
 
 INITIAL_SIZE = 50
 COLOR_SELECTED = QColor(Qt.red)
 COLOR_BORDER = QColor(Qt.gray)
+# shapes smaller than this many device pixels are drawn as plain rects, below one pixel as points
+LOD_SIZE = 4
 
 
 class Shape(StorageObject, metaclass=ABCMeta):
+    __slots__ = ('_id', '_rect', '_activate', '_color', '_group')
     _linked_widget = None
     _is_current = False
-    _subclasses = {}
+    # tag -> class, filled in as each shape class is defined
+    _registry = {}
+    PRIMITIVE = None
 
-    @classmethod
-    def load_subclasses(cls) -> None:
-        for subclass in cls.__subclasses__():
-            cls._subclasses[subclass.__name__] = subclass
-            subclass.load_subclasses()
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        Shape._registry[cls.__name__] = cls
 
     def __init__(self, point, color, length=INITIAL_SIZE, activate=False, width=None, height=None, _id=None):
         if not hasattr(self.__class__, '_counter'):
@@ -28,7 +32,9 @@ class Shape(StorageObject, metaclass=ABCMeta):
             self.__class__._counter += 1
             self._id = self.__class__._counter
         else:
+            # loaded ids stay ahead of the counter, so (class, id) keeps naming one shape
             self._id = _id
+            self.__class__._counter = max(self.__class__._counter, _id)
         super().__init__()
         width = length if width is None else width
         height = length if height is None else height
@@ -36,6 +42,7 @@ class Shape(StorageObject, metaclass=ABCMeta):
         self._rect.moveCenter(point)
         self._activate = activate
         self._color = color
+        self._group = None
 
     def getName(self) -> str:
         return f'{self.__class__.__name__} {self._id}'
@@ -66,19 +73,18 @@ class Shape(StorageObject, metaclass=ABCMeta):
     @color.setter
     def color(self, color: QColor) -> None:
         self._color = color
+        self.notifyObservers()
 
     @abstractmethod
     def draw(self, painter) -> None:
         pass
 
-    def paint(self, painter) -> None:
-        if not painter.isActive():
-            return
-        painter.save()
-        painter.setPen(QPen(COLOR_BORDER, 0, Qt.SolidLine))
-        painter.setBrush(QBrush(self.color, Qt.SolidPattern))
-        self.draw(painter)
-        painter.restore()
+    @staticmethod
+    def deviceScale(painter) -> float:
+        return painter.device().devicePixelRatioF() * abs(painter.worldTransform().m11())
+
+    def isTiny(self, scale: float) -> bool:
+        return min(self._rect.width(), self._rect.height()) * scale < LOD_SIZE
 
     def changeFlag(self) -> None:
         self._activate = not self._activate
@@ -92,6 +98,8 @@ class Shape(StorageObject, metaclass=ABCMeta):
         self.notifyObservers()
 
     def deactivate(self) -> None:
+        if not self._activate:
+            return
         self._activate = False
         self.notifyObservers()
 
@@ -110,51 +118,81 @@ class Shape(StorageObject, metaclass=ABCMeta):
     def is_valid_size(shape_copy: QRect) -> bool:
         return shape_copy.width() >= 10 and shape_copy.height() >= 10
 
-    def move_inplace(self, canvas: QRect, dx, dy) -> bool:
+    def _invalidateGroupBounds(self) -> None:
+        group = self._group() if self._group is not None else None
+        if group is not None:
+            group._invalidateBounds()
+
+    def translate(self, dx, dy) -> None:
         old_rect = self._rect
+        self._translate(dx, dy)
+        self._invalidateGroupBounds()
+        self.notifyObservers(old_rect=old_rect)
+
+    def _translate(self, dx, dy) -> None:
         self._rect = self._rect.translated(dx, dy)
-        if not self.is_inner_canvas(canvas):
-            self._rect = old_rect
-            return False
-        self.notifyObservers()
-        return True
 
-    def change_size(self, canvas: QRect, dsize) -> bool:
+    def resized_rect(self, dsize) -> QRect:
+        return self._rect + self.addMargins(dsize)
+
+    def can_change_size(self, dsize) -> bool:
+        return self.is_valid_size(self.resized_rect(dsize))
+
+    def resize(self, dsize) -> None:
         old_rect = self._rect
+        self._resize(dsize)
+        self._invalidateGroupBounds()
+        self.notifyObservers(old_rect=old_rect)
+
+    def _resize(self, dsize) -> None:
         self._rect = self._rect + self.addMargins(dsize)
-        if not (self.is_inner_canvas(canvas) and self.is_valid_size(self._rect)):
-            self._rect = old_rect
-            return False
-        self.notifyObservers()
-        return True
+
+    def snapshot(self) -> ShapeSnapshot:
+        rect = self._rect
+        return ShapeSnapshot(self.__class__.__name__, self._id,
+                             (rect.x(), rect.y(), rect.width(), rect.height()), self._color.rgba(), None)
 
     def save(self) -> ET:
-        element = ET.Element(self.__class__.__name__)
-        element.set('color', self.color.name())
-        element.set('id', str(self._id))
+        return self.saveSnapshot(self.snapshot())
+
+    @staticmethod
+    def subclass(tag: str):
+        return Shape._registry.get(tag)
+
+    @classmethod
+    def saveSnapshot(cls, snapshot: ShapeSnapshot) -> ET:
+        return cls.subclass(snapshot.tag)._save(snapshot)
+
+    @classmethod
+    def _save(cls, snapshot: ShapeSnapshot) -> ET:
+        element = ET.Element(snapshot.tag)
+        element.set('color', QColor.fromRgba(snapshot.color).name())
+        element.set('id', str(snapshot.id))
         rect = ET.SubElement(element, 'rect')
-        rect.set('left', str(self.rect.x()))
-        rect.set('top', str(self.rect.y()))
-        rect.set('width', str(self.rect.width()))
-        rect.set('height', str(self.rect.height()))
+        for name, value in zip(['left', 'top', 'width', 'height'], snapshot.rect):
+            rect.set(name, str(value))
         return element
 
     @classmethod
-    def load(cls, element: ET) -> 'Shape':
-        if not cls._subclasses:
-            cls.load_subclasses()
-        if element.tag in cls._subclasses:
-            return cls._subclasses[element.tag]._factory_load(element)
+    def parse(cls, element: ET) -> ShapeSnapshot:
+        subclass = cls.subclass(element.tag)
+        if subclass is not None:
+            return subclass._parse(element)
 
     @classmethod
-    def _factory_load(cls, element: ET) -> 'Shape':
+    def _parse(cls, element: ET) -> ShapeSnapshot:
         rect = element.find('rect')
-        rect = QRect(*map(int, (rect.get(s, 0) for s in
-                                ['left', 'top', 'width', 'height']
-                                )))
-        point = rect.center()
-        color = QColor(element.get('color', Qt.black))
-        width = rect.width()
-        height = rect.height()
+        rect = tuple(int(rect.get(s, 0)) for s in ['left', 'top', 'width', 'height'])
+        color = QColor(element.get('color', Qt.black)).rgba()
         _id = int(element.get('id', 0))
-        return cls(point, color, width=width, height=height, _id=_id)
+        return ShapeSnapshot(cls.__name__, _id, rect, color, None)
+
+    @classmethod
+    def fromSnapshot(cls, snapshot: ShapeSnapshot) -> 'Shape':
+        return cls.subclass(snapshot.tag)._factory_snapshot(snapshot)
+
+    @classmethod
+    def _factory_snapshot(cls, snapshot: ShapeSnapshot) -> 'Shape':
+        rect = QRect(*snapshot.rect)
+        return cls(rect.center(), QColor.fromRgba(snapshot.color),
+                   width=rect.width(), height=rect.height(), _id=snapshot.id)
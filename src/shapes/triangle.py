@@ -4,17 +4,27 @@ from PyQt5.QtGui import QPolygon
 import xml.etree.ElementTree as ET
 
 from .shape import Shape
+from ..snapshot import ShapeSnapshot
 
 
 ### CLASS TRIANGLE ###
 class Triangle(Shape):
+    __slots__ = ('_polygon',)
+    PRIMITIVE = 'polygon'
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self._rect.setHeight(int(round(self._rect.width() * math.sqrt(3) / 2)))
-        self._polygon = QPolygon([
-            QPoint(self._rect.center().x(), self._rect.top()),
-            self._rect.bottomRight(),
-            self._rect.bottomLeft()
+        # loaded triangles keep their stored height, resizing may have changed the proportions
+        if kwargs.get('height') is None:
+            self._rect.setHeight(int(round(self._rect.width() * math.sqrt(3) / 2)))
+        self._polygon = self.polygonFor(self._rect)
+
+    @staticmethod
+    def polygonFor(rect: QRect) -> QPolygon:
+        return QPolygon([
+            QPoint(rect.center().x(), rect.top()),
+            rect.bottomRight(),
+            rect.bottomLeft()
         ])
 
     def draw(self, painter) -> None:
@@ -23,26 +33,21 @@ class Triangle(Shape):
     def isSelected(self, point) -> bool:
         return self._polygon.containsPoint(point, Qt.WindingFill)
 
-    def move_inplace(self, canvas, dx, dy) -> bool:
-        if super().move_inplace(canvas, dx, dy):
-            self._polygon.translate(dx, dy)
-
-    def change_size(self, canvas: QRect, dsize) -> bool:
-        result = super().change_size(canvas, dsize)
-        if result:
-            self._polygon = QPolygon([
-                QPoint(self._rect.center().x(), self._rect.top()),
-                self._rect.bottomRight(),
-                self._rect.bottomLeft()
-            ])
-        return result
-
-    def save(self) -> ET:
-        element = super().save()
+    def _translate(self, dx, dy) -> None:
+        super()._translate(dx, dy)
+        self._polygon.translate(dx, dy)
+
+    def _resize(self, dsize) -> None:
+        super()._resize(dsize)
+        self._polygon = self.polygonFor(self._rect)
+
+    @classmethod
+    def _save(cls, snapshot: ShapeSnapshot) -> ET:
+        element = super()._save(snapshot)
         polygon = ET.SubElement(element, 'polygon')
         points = ET.SubElement(polygon, 'points')
         points.set('count_points', '3')
-        for point in self._polygon:
+        for point in cls.polygonFor(QRect(*snapshot.rect)):
             el_point = ET.SubElement(points, 'point')
             el_point.set('x', str(point.x()))
             el_point.set('y', str(point.y()))
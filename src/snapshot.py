@@ -0,0 +1,5 @@
+from collections import namedtuple
+
+# immutable copy of a shape: class name, id, (left, top, width, height), RGBA color
+# and a tuple of child snapshots for groups (None for plain shapes)
+ShapeSnapshot = namedtuple('ShapeSnapshot', ['tag', 'id', 'rect', 'color', 'children'])
@@ -0,0 +1,90 @@
+from typing import Iterable, Iterator
+
+from PyQt5.QtCore import QRect, QPoint
+
+CELL_SIZE = 64
+
+
+### UNIFORM GRID ###
+class GridIndex:
+    # cells hold dicts used as ordered sets, so removing a shape from a crowded cell stays O(1)
+    def __init__(self, cell_size: int = CELL_SIZE):
+        self._cell_size = cell_size
+        self._cells = {}
+        self._entries = {}
+        self._order = {}
+        self._counter = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, item) -> bool:
+        return item in self._entries
+
+    def _cellRange(self, rect: QRect):
+        size = self._cell_size
+        return (rect.left() // size, rect.top() // size,
+                rect.right() // size, rect.bottom() // size)
+
+    def _cellsOf(self, cell_range) -> Iterator[tuple]:
+        left, top, right, bottom = cell_range
+        for x in range(left, right + 1):
+            for y in range(top, bottom + 1):
+                yield x, y
+
+    def insert(self, item) -> None:
+        if item in self._entries:
+            self.update(item)
+            return
+        self._counter += 1
+        self._order[item] = self._counter
+        cell_range = self._cellRange(item.rect)
+        self._entries[item] = cell_range
+        for cell in self._cellsOf(cell_range):
+            self._cells.setdefault(cell, {})[item] = None
+
+    def remove(self, item) -> None:
+        cell_range = self._entries.pop(item, None)
+        if cell_range is None:
+            return
+        del self._order[item]
+        for cell in self._cellsOf(cell_range):
+            bucket = self._cells[cell]
+            del bucket[item]
+            if not bucket:
+                del self._cells[cell]
+
+    def update(self, item) -> None:
+        old_range = self._entries.get(item)
+        if old_range is None:
+            return
+        new_range = self._cellRange(item.rect)
+        if new_range == old_range:
+            return
+        old_cells = set(self._cellsOf(old_range))
+        new_cells = set(self._cellsOf(new_range))
+        for cell in old_cells - new_cells:
+            bucket = self._cells[cell]
+            del bucket[item]
+            if not bucket:
+                del self._cells[cell]
+        for cell in new_cells - old_cells:
+            self._cells.setdefault(cell, {})[item] = None
+        self._entries[item] = new_range
+
+    def reorder(self, items: Iterable) -> None:
+        self._order = {item: order for order, item in enumerate(items, 1)}
+        self._counter = len(self._order)
+
+    def clear(self) -> None:
+        self._cells.clear()
+        self._entries.clear()
+        self._order.clear()
+
+    def sortedByOrder(self, items: Iterable, reverse: bool = False) -> list:
+        return sorted(items, key=self._order.__getitem__, reverse=reverse)
+
+    def itemsAt(self, point: QPoint) -> list:
+        size = self._cell_size
+        bucket = self._cells.get((point.x() // size, point.y() // size), ())
+        return self.sortedByOrder(bucket, reverse=True)
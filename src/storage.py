@@ -1,13 +1,42 @@
+import os
+import shutil
 from typing import Generator
+from uuid import uuid4
 import xml.etree.ElementTree as ET
 
-from .shapes import Shape
+from PyQt5.QtCore import QPoint, QRect
+from PyQt5.QtGui import QRegion
+
+from . import binary_format
+from .content_bounds import ContentBounds
+from .history import History, HISTORY_LIMIT, AddCommand, DeleteCommand, GroupCommand, MoveCommand, \
+    RecolorCommand, ResizeCommand
+from .instrumentation import instrumentation
+from .observer import Observer
+from .shapes import Shape, Group
+from .spatial_index import GridIndex
 from .storage_object import StorageObject
 
+DAMAGE_MARGIN = 2
+MAX_DAMAGE_RECTS = 32
+LOAD_CHUNK_SIZE = 1000
+
 
 ### MY STORAGE ###
 class Storage:
-    arr = []
+    def __init__(self, *args, history_limit=HISTORY_LIMIT, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.arr = []
+        self._index = GridIndex()
+        self._bounds = ContentBounds()
+        self._selected = {}
+        # immutable snapshots of top-level shapes that have not changed since they were taken
+        self._snapshots = {}
+        self._damage = []
+        self._full_damage = True
+        self.staticRevision = 0
+        self._history = History(history_limit)
+        self._journal = None
 
     def __len__(self):
         return len(self.arr)
@@ -17,40 +46,350 @@ class Storage:
 
     def addItem(self, item: StorageObject):
         if item is not None:
+            self.addItems([item])
+            self._record(AddCommand([item]))
+
+    def addItems(self, items):
+        for item in items:
             self.arr.append(item)
+            self._register(item)
+
+    def addSnapshots(self, snapshots):
+        items = [Shape.fromSnapshot(snapshot) for snapshot in snapshots]
+        self.addItems(items)
+        # a loaded shape saves back to what it was loaded from, so the first save after a load is cheap too
+        self._snapshots.update(zip(items, snapshots))
+
+    def _register(self, item):
+        self._index.insert(item)
+        self._bounds.add(item)
+        item.addObserver(self)
+        self.addDamage(item.rect)
+        if item.getStatus():
+            self._selected[item] = None
+        else:
+            self.staticRevision += 1
+
+    def update(self, item, *args, old_rect=None, **kwargs):
+        snapshot = self._snapshots.get(item)
+        # selection is not part of a snapshot, geometry, color and children are
+        if snapshot is not None and (old_rect is not None or 'new_children' in kwargs
+                                     or snapshot.color != item._color.rgba()):
+            del self._snapshots[item]
+        if old_rect is not None:
+            self.addDamage(old_rect)
+        self.addDamage(item.rect)
+        self._index.update(item)
+        self._bounds.update(item)
+        if item.getStatus():
+            self._selected[item] = None
+        else:
+            self._selected.pop(item, None)
+        if old_rect is None or not item.getStatus():
+            self.staticRevision += 1
+
+    def addDamage(self, rect: QRect):
+        if not self._full_damage:
+            self._damage.append(rect.adjusted(-DAMAGE_MARGIN, -DAMAGE_MARGIN, DAMAGE_MARGIN, DAMAGE_MARGIN))
+
+    def invalidate(self):
+        self._full_damage = True
+        self.staticRevision += 1
+        self._damage.clear()
+
+    def takeDamage(self):
+        if self._full_damage:
+            self._full_damage = False
+            return None
+        damage = self._damage
+        self._damage = []
+        if len(damage) > MAX_DAMAGE_RECTS:
+            bounds = QRect()
+            for rect in damage:
+                bounds = bounds.united(rect)
+            return QRegion(bounds)
+        region = QRegion()
+        for rect in damage:
+            region = region.united(rect)
+        return region
+
+    def contentBounds(self) -> QRect:
+        return self._bounds.bounds()
+
+    def itemsAt(self, point: QPoint) -> list:
+        return self._index.itemsAt(point)
+
+    def batch(self):
+        return Observer.batch()
 
     def deact_all(self):
-        for i in self.arr:
-            i.deactivate()
+        with self.batch():
+            for i in list(self._selected):
+                i.deactivate()
+
+    def _compact(self, targets, group=None) -> list:
+        kept, removed, runs, placed = [], [], [], []
+        for row, item in enumerate(self.arr):
+            if item in targets:
+                if runs and runs[-1][0] + runs[-1][1] == row:
+                    runs[-1][1] += 1
+                else:
+                    runs.append([row, 1])
+                removed.append(item)
+                placed.append((row, item))
+            else:
+                kept.append(item)
+        for item in removed:
+            item.removeObserver(self)
+            self.addDamage(item.rect)
+            self._index.remove(item)
+            self._snapshots.pop(item, None)
+            self._bounds.remove(item)
+            if item in self._selected:
+                del self._selected[item]
+            else:
+                self.staticRevision += 1
+        self._replaceRows(runs, kept, removed, group)
+        return placed
+
+    def _replaceRows(self, runs, kept, removed, group=None):
+        self.arr = kept
+        if group is not None:
+            group.addChildren(removed)
+
+    def _removeItems(self, items) -> list:
+        return self._compact(set(items))
+
+    def _restoreItems(self, placed) -> None:
+        # puts removed items back at the rows they had, so paint and tree order come back too
+        self._insertRows(placed)
+        for _, item in placed:
+            self._register(item)
+        self._index.reorder(self.arr)
+
+    def _insertRows(self, placed) -> None:
+        arr = []
+        rest = iter(self.arr)
+        for row, item in placed:
+            while len(arr) < row:
+                arr.append(next(rest))
+            arr.append(item)
+        arr.extend(rest)
+        self.arr = arr
 
     def deleteAllActive(self):
-        for i in range(len(self.arr) - 1, -1, -1):
-            if self.arr[i].getStatus():
-                self.arr.remove(self.arr[i])
+        if self._selected:
+            self._record(DeleteCommand(self._compact(self._selected)))
+
+    def groupAllActive(self) -> Group:
+        if not self._selected:
+            return None
+        group = Group()
+        placed = self._groupItems(self._selected, group)
+        self._record(GroupCommand(group, placed))
+        return group
+
+    def _groupItems(self, targets, group: Group) -> list:
+        with self.batch(), self._history.suspended():
+            # the group takes its row first so the grouped rows can move under it
+            self.addItem(group)
+            return self._compact(targets, group)
 
-    def getActiveItems(self) -> Generator[StorageObject, None, None]:
-        for i in self.arr:
-            if i.getStatus():
-                yield i
+    def selectionBounds(self) -> QRect:
+        bounds = QRect()
+        for item in self._selected:
+            bounds = bounds.united(item.rect)
+        return bounds
 
+    def moveSelected(self, canvas: QRect, dx, dy) -> bool:
+        if not self._selected or not (dx or dy):
+            return False
+        if self.selectionBounds().translated(dx, dy).united(canvas) != canvas:
+            return False
+        items = list(self._selected)
+        with self.batch():
+            for item in items:
+                item.translate(dx, dy)
+        self._record(MoveCommand(items, dx, dy))
+        return True
+
+    def resizeSelected(self, canvas: QRect, dsize) -> bool:
+        if not self._selected or not dsize:
+            return False
+        bounds = QRect()
+        for item in self._selected:
+            if not item.can_change_size(dsize):
+                return False
+            bounds = bounds.united(item.resized_rect(dsize))
+        if bounds.united(canvas) != canvas:
+            return False
+        items = list(self._selected)
+        with self.batch():
+            for item in items:
+                item.resize(dsize)
+        self._record(ResizeCommand(items, dsize))
+        return True
+
+    def recolorAllActive(self, color):
+        items = list(self._selected)
+        if items:
+            self._record(RecolorCommand(items, [item._color for item in items], color))
+        with self.batch():
+            for item in items:
+                item.color = color
+            self.deact_all()
+
+    ### HISTORY ###
+    @property
+    def history(self) -> History:
+        return self._history
+
+    @property
+    def journal(self):
+        return self._journal
+
+    @journal.setter
+    def journal(self, journal):
+        if self._journal is not None and self._journal is not journal:
+            self._journal.close()
+        self._journal = journal
+
+    def _record(self, command) -> None:
+        if self._history.recording:
+            self._history.record(command)
+            if self._journal is not None:
+                self._journal.append(command)
+
+    def undo(self) -> bool:
+        return self._replay(self._history.takeUndo(), undo=True)
+
+    def redo(self) -> bool:
+        return self._replay(self._history.takeRedo(), undo=False)
+
+    def _replay(self, command, undo: bool) -> bool:
+        if command is None:
+            return False
+        with self.batch(), self._history.suspended():
+            if undo:
+                command.undo(self)
+            else:
+                command.redo(self)
+        if self._journal is not None:
+            self._journal.append(command, undo)
+        return True
+
+    def getActiveItems(self) -> list:
+        return self._index.sortedByOrder(self._selected)
+
+    def selectedCount(self) -> int:
+        return len(self._selected)
+
+    def snapshot(self) -> tuple:
+        # cheap enough for the GUI thread: only shapes changed since the last call are copied again
+        snapshots = self._snapshots
+        result = []
+        for elem in self.arr:
+            snapshot = snapshots.get(elem)
+            if snapshot is None:
+                snapshot = snapshots[elem] = elem.snapshot()
+            result.append(snapshot)
+        return tuple(result)
+
+    @instrumentation.timed('Storage.save', 'io')
     def save(self, filename: str):
+        self.saveSnapshot(self.snapshot(), filename)
+
+    @staticmethod
+    @instrumentation.timed('Storage.saveSnapshot', 'io')
+    def saveSnapshot(snapshot, filename: str, progress=None, cancelled=None) -> bool:
+        # a temp file of its own, several saves of one document may be running at once
+        temp_filename = Storage._createTemp(filename)
+        try:
+            if binary_format.is_binary(filename):
+                saved = binary_format.save(snapshot, temp_filename, progress, cancelled, LOAD_CHUNK_SIZE)
+            else:
+                saved = Storage._saveXml(snapshot, temp_filename, progress, cancelled)
+            if saved:
+                if os.path.exists(filename):
+                    # replacing the document must not reset the permissions it was given
+                    shutil.copymode(filename, temp_filename)
+                os.replace(temp_filename, filename)
+            return saved
+        finally:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+
+    @staticmethod
+    def _createTemp(filename: str) -> str:
+        # created like any new file, so the umask applies
+        while True:
+            temp_filename = f'{filename}.{uuid4().hex[:8]}.tmp'
+            try:
+                open(temp_filename, 'xb').close()
+            except FileExistsError:
+                continue
+            return temp_filename
+
+    @staticmethod
+    def _saveXml(snapshot, filename: str, progress=None, cancelled=None) -> bool:
         root = ET.Element('storage')
         items = ET.SubElement(root, 'items')
-        for elem in self:
-            items.append(elem.save())
-        items.set('count_elements', str(len(self)))
+        total = len(snapshot) or 1
+        for i, elem in enumerate(snapshot, 1):
+            if cancelled is not None and cancelled():
+                return False
+            items.append(Shape.saveSnapshot(elem))
+            if progress is not None and not i % LOAD_CHUNK_SIZE:
+                progress(i / total)
+        items.set('count_elements', str(len(snapshot)))
         ET.indent(root, space='  ')
         result = ET.tostring(root, encoding='utf-8')
         with open(filename, 'wb') as f:
             f.write(result)
+        return True
 
     def clear(self):
         self.arr.clear()
+        self._index.clear()
+        self._bounds.clear()
+        self._selected.clear()
+        self._snapshots.clear()
+        self._history.clear()
+        self.invalidate()
 
-    def load(self, filename):
-        self.arr.clear()
-        root = ET.parse(filename).getroot()
-        assert root.tag == 'storage'
-        items = root.find('items')
-        for item in items:
-            self.addItem(Shape.load(item))
+    @staticmethod
+    def iterLoad(filename, chunk_size=LOAD_CHUNK_SIZE) -> Generator[tuple, None, None]:
+        if binary_format.is_binary(filename):
+            yield from binary_format.iterLoad(filename, chunk_size)
+            return
+        total = os.path.getsize(filename) or 1
+        with open(filename, 'rb') as f:
+            depth = 0
+            items = None
+            chunk = []
+            for event, element in ET.iterparse(f, events=('start', 'end')):
+                if event == 'start':
+                    depth += 1
+                    if depth == 1:
+                        assert element.tag == 'storage'
+                    elif depth == 2 and element.tag == 'items':
+                        items = element
+                    continue
+                depth -= 1
+                if depth == 2 and items is not None:
+                    snapshot = Shape.parse(element)
+                    items.remove(element)
+                    if snapshot is not None:
+                        chunk.append(snapshot)
+                    if len(chunk) >= chunk_size:
+                        yield chunk, f.tell() / total
+                        chunk = []
+            yield chunk, 1.0
+
+    @instrumentation.timed('Storage.load', 'io')
+    def load(self, filename, progress=None):
+        self.clear()
+        for chunk, done in self.iterLoad(filename):
+            self.addSnapshots(chunk)
+            if progress is not None:
+                progress(done)
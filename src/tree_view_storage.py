@@ -1,31 +1,286 @@
-import typing
-from typing import Generator
+from weakref import WeakKeyDictionary
 
-from PyQt5.QtGui import QStandardItemModel
+from PyQt5.QtCore import QAbstractItemModel, QModelIndex, Qt
+from PyQt5.QtGui import QColor
 
+from .instrumentation import instrumentation
+from .observer import Observer
+from .shapes import Group
 from .storage import Storage
-from .storage_object import StorageObject
 
+FETCH_BATCH = 256
+MAX_ROW_RUNS = 32
 
-class TreeViewStorage(Storage, QStandardItemModel):
+
+class TreeViewStorage(Storage, QAbstractItemModel):
     def __init__(self, parent=None, *args, **kwargs, ):
         super().__init__(*args, **kwargs)
-        self.setHorizontalHeaderLabels(['Shapes'])
+        self._syncing = 0
+        # rows whose display changed, emitted together once the current batch is over
+        self._changed = {}
+        self._topRows = {}
+        self._childRows = WeakKeyDictionary()
+        self._fetched = WeakKeyDictionary()
+        self._fetching = False
+        self._moving = False
         if parent:
             self.setParent(parent)
         self.dataChanged.connect(self._data_changed)
 
-    def addItem(self, item: StorageObject):
-        super().addItem(item)
-        item.get_item().setParent(self.invisibleRootItem())
-
-    def _data_changed(self, *args, **kwargs):
-        for item in self:
-            tv_item = item.get_item()
-            if tv_item.checkState() != item.getStatus():
-                item.setStatus(tv_item.checkState())
-                if tv_item.hasChildren():
-                    for row in range(tv_item.rowCount()):
-                        for column in range(tv_item.columnCount()):
-                            tv_item.child(row, column).setCheckState(tv_item.checkState())
-        self.parent().window().update()
+    ### MODEL INTERFACE ###
+    def index(self, row, column, parent=QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        if parent.isValid():
+            return self.createIndex(row, column, parent.internalPointer()[row])
+        return self.createIndex(row, column, self.arr[row])
+
+    def parent(self, *args):
+        if not args:
+            return super().parent()
+        index = args[0]
+        if not index.isValid():
+            return QModelIndex()
+        group = self._groupOf(index.internalPointer())
+        if group is None:
+            return QModelIndex()
+        return self.createIndex(self._rowOf(group), 0, group)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        if not parent.isValid():
+            return len(self.arr)
+        return self._fetched.get(parent.internalPointer(), 0)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def hasChildren(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return bool(self.arr)
+        item = parent.internalPointer()
+        return isinstance(item, Group) and len(item) > 0
+
+    def canFetchMore(self, parent):
+        if self._fetching or not parent.isValid():
+            return False
+        item = parent.internalPointer()
+        return isinstance(item, Group) and self._fetched.get(item, 0) < len(item)
+
+    def fetchMore(self, parent):
+        if not self.canFetchMore(parent):
+            return
+        item = parent.internalPointer()
+        fetched = self._fetched.get(item, 0)
+        count = min(FETCH_BATCH, len(item) - fetched)
+        # views and testers may ask for more rows again from inside the insert signals
+        self._fetching = True
+        try:
+            self.beginInsertRows(parent, fetched, fetched + count - 1)
+            self._fetched[item] = fetched + count
+            self.endInsertRows()
+        finally:
+            self._fetching = False
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        item = index.internalPointer()
+        if role == Qt.DisplayRole:
+            return item.getName()
+        if role == Qt.CheckStateRole:
+            return Qt.Checked if item.getStatus() else Qt.Unchecked
+        if role == Qt.ForegroundRole:
+            return QColor(Qt.black) if item.getStatus() else item._color
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.CheckStateRole:
+            return False
+        item = index.internalPointer()
+        if bool(item.getStatus()) != (value == Qt.Checked):
+            item.setStatus(value == Qt.Checked)
+        self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+        return True
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        if self._groupOf(index.internalPointer()) is None:
+            flags |= Qt.ItemIsUserCheckable
+        return flags
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole and section == 0:
+            return 'Shapes'
+        return None
+
+    ### ROW LOOKUP ###
+    @staticmethod
+    def _groupOf(item):
+        return item._group() if item._group is not None else None
+
+    def _rowOf(self, item) -> int:
+        group = self._groupOf(item)
+        if group is None:
+            if self._topRows is None:
+                self._topRows = {elem: row for row, elem in enumerate(self.arr)}
+            return self._topRows[item]
+        rows = self._childRows.get(group)
+        if rows is None:
+            rows = self._childRows[group] = {elem: row for row, elem in enumerate(group)}
+        return rows[item]
+
+    def indexOf(self, item) -> QModelIndex:
+        return self.createIndex(self._rowOf(item), 0, item)
+
+    def _collectChildren(self, group, rows) -> None:
+        # a group's state shows on every row below it that the view has fetched
+        fetched = self._fetched.get(group, 0)
+        if fetched:
+            rows.setdefault(group, set()).update(range(fetched))
+            for row in range(fetched):
+                if isinstance(group[row], Group):
+                    self._collectChildren(group[row], rows)
+
+    @staticmethod
+    def _rowRanges(rows) -> list:
+        ranges = []
+        for row in sorted(rows):
+            if ranges and ranges[-1][1] + 1 == row:
+                ranges[-1][1] = row
+            else:
+                ranges.append([row, row])
+        return ranges
+
+    ### STORAGE HOOKS ###
+    def addItems(self, items):
+        if not items:
+            return
+        first = len(self.arr)
+        self.beginInsertRows(QModelIndex(), first, first + len(items) - 1)
+        super().addItems(items)
+        if self._topRows is not None:
+            for row, item in enumerate(items, first):
+                self._topRows[item] = row
+        self.endInsertRows()
+
+    def update(self, item, *args, old_rect=None, **kwargs):
+        super().update(item, *args, old_rect=old_rect, **kwargs)
+        if 'new_children' in kwargs:
+            self._childRows.pop(item, None)
+        elif old_rect is not None:
+            return
+        if not self._moving:
+            self._refreshRow(item)
+
+    def _refreshRow(self, item) -> None:
+        self._changed[item] = None
+        if not Observer.afterBatch(self._flushChanged):
+            self._flushChanged()
+
+    def _flushChanged(self) -> None:
+        changed, self._changed = self._changed, {}
+        rows = {}
+        for item in changed:
+            # only top-level shapes notify the model, the rest were deleted or grouped since
+            if item in self._index:
+                rows.setdefault(None, set()).add(self._rowOf(item))
+                if isinstance(item, Group):
+                    self._collectChildren(item, rows)
+        self._syncing += 1
+        try:
+            for group, group_rows in rows.items():
+                parent = QModelIndex() if group is None else self.indexOf(group)
+                for first, last in self._rowRanges(group_rows):
+                    self.dataChanged.emit(self.index(first, 0, parent), self.index(last, 0, parent))
+        finally:
+            self._syncing -= 1
+
+    def _replaceRows(self, runs, kept, removed, group=None):
+        self._moving = True
+        try:
+            if len(runs) > MAX_ROW_RUNS:
+                self.beginResetModel()
+                super()._replaceRows(runs, kept, removed, group)
+                self._topRows = None
+                self.endResetModel()
+            elif group is None:
+                for start, count in reversed(runs):
+                    self.beginRemoveRows(QModelIndex(), start, start + count - 1)
+                    del self.arr[start:start + count]
+                    self._topRows = None
+                    self.endRemoveRows()
+            else:
+                self._moveRows(runs, group)
+        finally:
+            self._moving = False
+        if group is not None:
+            self._refreshRow(group)
+        else:
+            # removed rows may come back through the history with other children
+            for item in removed:
+                self._fetched.pop(item, None)
+                self._childRows.pop(item, None)
+
+    def _insertRows(self, placed):
+        runs = []
+        for row, item in placed:
+            if runs and runs[-1][0] + len(runs[-1][1]) == row:
+                runs[-1][1].append(item)
+            else:
+                runs.append((row, [item]))
+        if len(runs) > MAX_ROW_RUNS:
+            self.beginResetModel()
+            super()._insertRows(placed)
+            self._topRows = None
+            self.endResetModel()
+            return
+        for start, items in runs:
+            self.beginInsertRows(QModelIndex(), start, start + len(items) - 1)
+            self.arr[start:start] = items
+            self._topRows = None
+            self.endInsertRows()
+
+    def _moveRows(self, runs, group):
+        # same shape objects, new parent: views keep their indexes, expansion and selection
+        moved = 0
+        for start, count in runs:
+            start -= moved
+            destination = self.createIndex(len(self.arr) - 1, 0, group)
+            self.beginMoveRows(QModelIndex(), start, start + count - 1, destination, len(group))
+            items = self.arr[start:start + count]
+            del self.arr[start:start + count]
+            self._topRows = None
+            group.addChildren(items)
+            self._fetched[group] = len(group)
+            self.endMoveRows()
+            moved += count
+
+    def clear(self):
+        self.beginResetModel()
+        super().clear()
+        self._topRows = {}
+        self._childRows.clear()
+        self._fetched.clear()
+        self.endResetModel()
+
+    def _itemsBetween(self, topLeft, bottomRight) -> list:
+        parent = topLeft.parent()
+        container = parent.internalPointer() if parent.isValid() else self.arr
+        last = min(bottomRight.row(), self.rowCount(parent) - 1)
+        return [container[row] for row in range(topLeft.row(), last + 1)]
+
+    @instrumentation.timed('TreeViewStorage._data_changed', 'model')
+    def _data_changed(self, topLeft, bottomRight, roles=()):
+        if self._syncing or not topLeft.isValid():
+            return
+        self._syncing += 1
+        try:
+            for item in self._itemsBetween(topLeft, bottomRight):
+                self.addDamage(item.rect)
+            self.parent().window().update()
+        finally:
+            self._syncing -= 1
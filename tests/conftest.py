@@ -0,0 +1,46 @@
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtCore import QPoint, QRect
+from PyQt5.QtGui import QColor
+from PyQt5.QtWidgets import QApplication
+
+from src.shapes import Circle, Rectangle, Triangle
+from src.storage import Storage
+
+CANVAS = QRect(0, 0, 1000, 800)
+
+
+@pytest.fixture(scope='session', autouse=True)
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+def select(items) -> None:
+    for item in items:
+        item.setStatus(True)
+
+
+def build_scene(storage):
+    # nine shapes in rows, rows 2-4 grouped, with the group nested in a second one together with row 5
+    kinds = (Circle, Rectangle, Triangle)
+    storage.addItems([kinds[i % 3](QPoint(100 + 80 * i, 100 + 40 * (i % 2)), QColor.fromRgb(20 * i, 100, 200 - 20 * i),
+                                   length=30 + 4 * i) for i in range(9)])
+    select(storage[2:5])
+    inner = storage.groupAllActive()
+    storage.deact_all()
+    select([inner, storage[2]])
+    storage.groupAllActive()
+    storage.deact_all()
+    storage.history.clear()
+    return storage
+
+
+@pytest.fixture
+def storage():
+    return build_scene(Storage())
@@ -0,0 +1,93 @@
+import os
+import stat
+import sys
+
+import pytest
+from PyQt5.QtGui import QColor
+
+from src import binary_format
+from src.shapes import Group, Triangle
+from src.storage import Storage
+
+from conftest import CANVAS, select
+
+
+@pytest.fixture(params=['xml', 'shb'])
+def filename(request, tmp_path):
+    return str(tmp_path / f'scene.{request.param}')
+
+
+def reload(filename: str) -> Storage:
+    storage = Storage()
+    storage.load(filename)
+    return storage
+
+
+def test_round_trip_keeps_nested_groups(storage, filename):
+    storage.save(filename)
+    loaded = reload(filename)
+    assert loaded.snapshot() == storage.snapshot()
+    outer = loaded[-1]
+    assert isinstance(outer, Group) and any(isinstance(child, Group) for child in outer)
+    assert loaded.contentBounds() == storage.contentBounds()
+
+
+def test_round_trip_keeps_resized_triangles(storage, filename):
+    triangle = next(item for item in storage if isinstance(item, Triangle))
+    select([triangle])
+    assert storage.resizeSelected(CANVAS, 5)
+    storage.save(filename)
+    loaded = reload(filename)
+    assert loaded.snapshot() == storage.snapshot()
+    assert loaded[storage.arr.index(triangle)].rect == triangle.rect
+
+
+def test_loaded_shapes_keep_ids(storage, filename):
+    storage.save(filename)
+    assert [item.getName() for item in reload(filename)] == [item.getName() for item in storage]
+
+
+def test_truncated_binary_file_is_rejected(storage, tmp_path):
+    filename = str(tmp_path / 'scene.shb')
+    storage.save(filename)
+    with open(filename, 'rb') as f:
+        data = f.read()
+    with open(filename, 'wb') as f:
+        f.write(data[:-binary_format.RECORD.size])
+    with pytest.raises(ValueError):
+        reload(filename)
+
+
+def test_binary_load_without_numpy(storage, tmp_path, monkeypatch):
+    filename = str(tmp_path / 'scene.shb')
+    storage.save(filename)
+    monkeypatch.setitem(sys.modules, 'numpy', None)
+    assert binary_format.load(filename) == list(storage.snapshot())
+    Storage().save(filename)
+    assert binary_format.load(filename) == []
+
+
+def test_save_keeps_document_mode_and_leaves_no_temp_files(storage, filename):
+    storage.save(filename)
+    os.chmod(filename, 0o600)
+    storage.save(filename)
+    assert stat.S_IMODE(os.stat(filename).st_mode) == 0o600
+    assert os.listdir(os.path.dirname(filename)) == [os.path.basename(filename)]
+
+
+def test_snapshot_reuses_unchanged_shapes(storage, filename):
+    storage.save(filename)
+    loaded = reload(filename)
+    first = loaded.snapshot()
+    assert first == tuple(item.snapshot() for item in loaded)
+    select(loaded[:2])
+    assert all(a is b for a, b in zip(loaded.snapshot(), first))
+    loaded.moveSelected(CANVAS, 5, 5)
+    loaded.deact_all()
+    select([loaded[-1]])
+    loaded.resizeSelected(CANVAS, 5)
+    loaded.recolorAllActive(QColor(1, 2, 3))
+    loaded.undo()
+    second = loaded.snapshot()
+    assert second == tuple(item.snapshot() for item in loaded)
+    assert [a is b for a, b in zip(second, first)] == [False, False] + [True] * (len(first) - 3) + [False]
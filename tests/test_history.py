@@ -0,0 +1,155 @@
+import pytest
+from PyQt5.QtCore import QPoint, QRect
+from PyQt5.QtGui import QColor
+
+from src.history import History, MoveCommand
+from src.shapes import Circle, Group
+from src.storage import Storage
+from src.tree_view_storage import TreeViewStorage
+
+from conftest import CANVAS, build_scene, select
+
+
+@pytest.fixture(params=[Storage, TreeViewStorage], ids=['storage', 'model'])
+def storage(request):
+    return build_scene(request.param())
+
+
+def check_consistent(storage) -> None:
+    assert len(storage._index) == len(storage)
+    assert all(item in storage._index for item in storage)
+    bounds = QRect()
+    for item in storage:
+        bounds = bounds.united(item.rect)
+    assert storage.contentBounds() == bounds
+    assert storage.getActiveItems() == [item for item in storage if item.getStatus()]
+    if isinstance(storage, TreeViewStorage):
+        assert storage.rowCount() == len(storage)
+        assert [storage.index(row, 0).internalPointer() for row in range(len(storage))] == storage.arr
+
+
+def move(storage):
+    select(storage[1:3])
+    assert storage.moveSelected(CANVAS, 15, -10)
+
+
+def resize(storage):
+    select([storage[0], storage[-1]])
+    assert storage.resizeSelected(CANVAS, 5)
+
+
+def recolor(storage):
+    select([storage[0], storage[-1]])
+    storage.recolorAllActive(QColor(10, 20, 30))
+
+
+def group(storage):
+    select([storage[0], storage[3], storage[-1]])
+    assert storage.groupAllActive() is not None
+
+
+def delete(storage):
+    select([storage[1], storage[-1], storage[3]])
+    storage.deleteAllActive()
+
+
+@pytest.mark.parametrize('edit', [move, resize, recolor, group, delete])
+def test_undo_redo_round_trip(storage, edit):
+    before = storage.snapshot()
+    rows_before = list(storage)
+    edit(storage)
+    after = storage.snapshot()
+    rows_after = list(storage)
+    assert after != before
+    assert storage.undo()
+    assert storage.snapshot() == before
+    assert list(storage) == rows_before
+    check_consistent(storage)
+    assert storage.redo()
+    assert storage.snapshot() == after
+    assert list(storage) == rows_after
+    check_consistent(storage)
+    assert not storage.redo()
+
+
+def test_undo_ungroups_nested_groups(storage):
+    outer = storage[-1]
+    inner = next(child for child in outer if isinstance(child, Group))
+    before = storage.snapshot()
+    select([outer, storage[0]])
+    select([storage.groupAllActive()])
+    storage.deleteAllActive()
+    assert len(storage) == 4
+    assert storage.undo() and storage.undo()
+    assert storage.snapshot() == before
+    assert storage[-1] is outer and inner._group() is outer and outer._group is None
+
+
+class CountingObserver:
+    def __init__(self):
+        self.count = 0
+
+    def update(self, item, **kwargs):
+        self.count += 1
+
+
+def shapes_in(items):
+    for item in items:
+        yield item
+        if isinstance(item, Group):
+            yield from shapes_in(item)
+
+
+def test_rejected_resize_changes_nothing(storage):
+    # the smallest shape sits two groups deep, so the whole check has to run before any child is resized
+    storage.addItem(Circle(QPoint(500, 500), QColor(1, 2, 3), length=12))
+    select([storage[-2], storage[-1]])
+    storage.groupAllActive()
+    storage.deact_all()
+    storage.history.clear()
+    select([storage[-1]])
+    before = storage.snapshot()
+    rects = [item.rect for item in shapes_in(storage)]
+    observer = CountingObserver()
+    for item in shapes_in(storage):
+        item.addObserver(observer)
+    assert not storage.resizeSelected(CANVAS, -2)
+    assert storage.snapshot() == before
+    assert [item.rect for item in shapes_in(storage)] == rects
+    assert observer.count == 0
+    assert len(storage.history) == 0
+    assert storage.resizeSelected(CANVAS, 2)
+    assert observer.count and len(storage.history) == 1
+
+
+def test_drag_undoes_as_one_step(storage):
+    before = storage.snapshot()
+    select([storage[0]])
+    for _ in range(3):
+        assert storage.moveSelected(CANVAS, 5, 5)
+    assert len(storage.history) == 1
+    storage.history.seal()
+    assert storage.moveSelected(CANVAS, 5, 5)
+    assert len(storage.history) == 2
+    assert storage.undo() and storage.undo()
+    assert storage.snapshot() == before
+    assert not storage.undo()
+
+
+def test_new_edit_drops_redo(storage):
+    select([storage[0]])
+    storage.moveSelected(CANVAS, 5, 0)
+    storage.undo()
+    storage.moveSelected(CANVAS, 0, 5)
+    assert not storage.redo()
+
+
+def test_memory_cap_drops_oldest_entries(storage):
+    item = storage[0]
+    history = History(limit=3 * MoveCommand([item], 0, 0).cost())
+    for dx in range(1, 11):
+        history.seal()
+        history.record(MoveCommand([item], dx, 0))
+    assert len(history) == 3
+    assert history.cost <= history.limit
+    assert history.takeUndo().dx == 10
@@ -0,0 +1,104 @@
+import pytest
+from PyQt5.QtCore import QPoint
+from PyQt5.QtGui import QColor
+
+from src.journal import Journal, journal_path
+from src.shapes import Rectangle
+from src.storage import Storage
+
+from conftest import CANVAS, select
+
+
+@pytest.fixture(params=['xml', 'shb'])
+def document(request, tmp_path, storage):
+    filename = str(tmp_path / f'scene.{request.param}')
+    storage.save(filename)
+    storage.journal = Journal(filename)
+    return filename
+
+
+def edit(storage) -> None:
+    select(storage[1:3])
+    storage.moveSelected(CANVAS, 10, 0)
+    storage.moveSelected(CANVAS, 0, 10)
+    storage.history.seal()
+    storage.resizeSelected(CANVAS, -5)
+    storage.deact_all()
+    select([storage[0], storage[-1]])
+    storage.recolorAllActive(QColor(10, 20, 30))
+    select([storage[0], storage[3], storage[-1]])
+    storage.groupAllActive()
+    storage.deact_all()
+    select([storage[1]])
+    storage.deleteAllActive()
+    storage.addItem(Rectangle(QPoint(500, 500), QColor(1, 2, 3)))
+    storage.undo()
+    storage.undo()
+    storage.redo()
+
+
+def crash(storage) -> None:
+    # the flush timer ran, but the journal is never closed
+    storage.journal.flush()
+
+
+def recover(document: str):
+    storage = Storage()
+    storage.load(document)
+    return storage, Journal.recover(storage, document)
+
+
+def test_replay_after_crash(storage, document):
+    saved = storage.snapshot()
+    edit(storage)
+    assert storage.snapshot() != saved
+    crash(storage)
+    recovered, lines = recover(document)
+    assert lines
+    assert recovered.snapshot() == storage.snapshot()
+    assert len(recovered.history) == 0
+
+
+def test_replay_stops_at_torn_line(storage, document):
+    edit(storage)
+    crash(storage)
+    with open(journal_path(document), 'a') as f:
+        f.write('{"op":"move","keys":[["Circle"')
+    recovered, lines = recover(document)
+    assert recovered.snapshot() == storage.snapshot()
+    assert all(line.endswith('}\n') for line in lines)
+
+
+def test_replay_after_save_interrupted_before_rebase(storage, document):
+    edit(storage)
+    storage.journal.checkpoint()
+    Storage.saveSnapshot(storage.snapshot(), document)
+    select([storage[0]])
+    storage.moveSelected(CANVAS, -5, -5)
+    crash(storage)
+    recovered, lines = recover(document)
+    assert len(lines) == 1
+    assert recovered.snapshot() == storage.snapshot()
+
+
+def test_rebase_keeps_only_later_edits(storage, document):
+    edit(storage)
+    token = storage.journal.checkpoint()
+    saved = storage.snapshot()
+    Storage.saveSnapshot(saved, document)
+    select([storage[0]])
+    storage.moveSelected(CANVAS, -5, -5)
+    storage.journal.rebase(document, token)
+    crash(storage)
+    recovered, lines = recover(document)
+    assert len(lines) == 1
+    assert recovered.snapshot() == storage.snapshot() != saved
+
+
+def test_journal_of_another_save_is_ignored(storage, document):
+    edit(storage)
+    crash(storage)
+    Storage.saveSnapshot(storage.snapshot()[1:], document)
+    recovered, lines = recover(document)
+    assert lines == []
+    assert recovered.snapshot() == storage.snapshot()[1:]
@@ -0,0 +1,41 @@
+from PyQt5.QtGui import QImage, QPainter
+
+from src.render import BatchRenderer
+from src.shapes import Group
+
+
+class RecordingPainter(QPainter):
+    def __init__(self, device):
+        super().__init__(device)
+        self.aliased = 0
+
+    def drawRects(self, rects):
+        if not self.testRenderHint(QPainter.Antialiasing):
+            self.aliased += len(rects)
+        super().drawRects(rects)
+
+
+def leaves(items):
+    for item in items:
+        if isinstance(item, Group):
+            yield from leaves(item)
+        else:
+            yield item
+
+
+def paint(storage, scale: float) -> int:
+    image = QImage(1000, 800, QImage.Format_ARGB32_Premultiplied)
+    image.fill(0)
+    painter = RecordingPainter(image)
+    painter.setRenderHint(QPainter.Antialiasing)
+    painter.scale(scale, scale)
+    BatchRenderer().paint(painter, storage)
+    assert painter.testRenderHint(QPainter.Antialiasing)
+    painter.end()
+    return painter.aliased
+
+
+def test_zoomed_out_shapes_are_drawn_as_aliased_rects(storage):
+    assert paint(storage, 1) == 0
+    # every shape is a few device pixels across, the groups around them still get their outlines
+    assert paint(storage, 0.05) == len(list(leaves(storage)))
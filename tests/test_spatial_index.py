@@ -0,0 +1,45 @@
+import random
+
+import pytest
+from PyQt5.QtCore import QPoint
+
+from conftest import CANVAS, select
+
+
+def topmost(storage, point: QPoint):
+    return next((item for item in storage.itemsAt(point) if item.isSelected(point)), None)
+
+
+def scan(storage, point: QPoint):
+    return next((item for item in reversed(storage.arr) if item.isSelected(point)), None)
+
+
+def check_hits(storage, rng) -> None:
+    # sample around the shapes so most points land on one, plus a margin of misses
+    area = storage.contentBounds().adjusted(-20, -20, 20, 20)
+    for _ in range(400):
+        point = QPoint(rng.randint(area.left(), area.right()), rng.randint(area.top(), area.bottom()))
+        assert topmost(storage, point) is scan(storage, point)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_hit_test_matches_linear_scan(storage, seed):
+    rng = random.Random(seed)
+    check_hits(storage, rng)
+    for _ in range(10):
+        storage.deact_all()
+        select(rng.sample(storage.arr, min(2, len(storage))))
+        storage.moveSelected(CANVAS, rng.randint(-60, 60), rng.randint(-60, 60))
+        check_hits(storage, rng)
+        storage.resizeSelected(CANVAS, rng.randint(-10, 20))
+        check_hits(storage, rng)
+    storage.deact_all()
+    select(storage[:3])
+    storage.groupAllActive()
+    check_hits(storage, rng)
+    storage.deact_all()
+    select([storage[1]])
+    storage.deleteAllActive()
+    check_hits(storage, rng)
+    storage.undo()
+    check_hits(storage, rng)
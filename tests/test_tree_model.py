@@ -0,0 +1,85 @@
+import random
+
+import pytest
+from PyQt5.QtCore import QPoint
+from PyQt5.QtGui import QColor
+from PyQt5.QtTest import QAbstractItemModelTester
+from PyQt5.QtWidgets import QTreeView
+
+from src.shapes import Circle, Rectangle, Triangle
+from src.tree_view_storage import TreeViewStorage
+
+from conftest import CANVAS, build_scene, select
+
+
+@pytest.fixture
+def model():
+    model = build_scene(TreeViewStorage())
+    tester = QAbstractItemModelTester(model, QAbstractItemModelTester.FailureReportingMode.Fatal)
+    view = QTreeView()
+    view.setModel(model)
+    view.expandAll()
+    yield model, view
+    view.setModel(None)
+    del tester
+
+
+def pick(rng, storage) -> None:
+    storage.deact_all()
+    if len(storage):
+        select(rng.sample(storage.arr, rng.randint(1, min(3, len(storage)))))
+
+
+def add(rng, storage) -> None:
+    kind = rng.choice((Circle, Rectangle, Triangle))
+    storage.addItem(kind(QPoint(rng.randrange(100, 900), rng.randrange(100, 700)), QColor(rng.randrange(256), 0, 0)))
+
+
+def group(rng, storage) -> None:
+    pick(rng, storage)
+    if storage.selectedCount() > 1:
+        storage.groupAllActive()
+
+
+def delete(rng, storage) -> None:
+    pick(rng, storage)
+    storage.deleteAllActive()
+
+
+def move(rng, storage) -> None:
+    pick(rng, storage)
+    storage.moveSelected(CANVAS, rng.randint(-20, 20), rng.randint(-20, 20))
+    storage.history.seal()
+
+
+def recolor(rng, storage) -> None:
+    pick(rng, storage)
+    storage.recolorAllActive(QColor(0, rng.randrange(256), 0))
+
+
+def undo(rng, storage) -> None:
+    storage.undo()
+
+
+def redo(rng, storage) -> None:
+    storage.redo()
+
+
+def check_rows(model) -> None:
+    assert model.rowCount() == len(model)
+    for row, item in enumerate(model):
+        index = model.index(row, 0)
+        assert index.internalPointer() is item
+        assert model.indexOf(item) == index
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_edits_keep_model_consistent(app, model, seed):
+    model, view = model
+    rng = random.Random(seed)
+    edits = (add, group, delete, move, recolor, undo, redo)
+    for _ in range(150):
+        rng.choice(edits)(rng, model)
+        view.expandAll()
+        app.processEvents()
+        check_rows(model)
@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+from PyQt5.QtCore import QPoint, QThreadPool
+from PyQt5.QtGui import QColor
+from PyQt5.QtWidgets import QMessageBox
+
+import main as editor
+from src.background import save_task
+from src.journal import CHECKPOINT, journal_path
+from src.shapes import Rectangle
+from src.storage import Storage
+
+
+def wait(app, done) -> None:
+    while not done():
+        app.processEvents()
+        QThreadPool.globalInstance().waitForDone(10)
+    app.processEvents()
+
+
+@pytest.fixture
+def window(app):
+    window = editor.Window()
+    yield window
+    wait(app, lambda: not window._tasks)
+    window.close()
+
+
+def open_document(app, window, filename: str) -> None:
+    window.openFile(filename)
+    wait(app, lambda: window.storage.journal.document == filename)
+
+
+def test_compaction_folds_journal_into_document(app, window, storage, tmp_path):
+    filename = str(tmp_path / 'scene.xml')
+    storage.save(filename)
+    open_document(app, window, filename)
+    window.storage.addItem(Rectangle(QPoint(500, 500), QColor(1, 2, 3)))
+    assert window.storage.journal.pending
+    window.compactJournal()
+    wait(app, lambda: not window._writing)
+    assert not window.storage.journal.pending
+    loaded = Storage()
+    loaded.load(filename)
+    assert loaded.snapshot() == window.storage.snapshot()
+    with open(journal_path(filename)) as f:
+        assert len(f.readlines()) == 1
+
+
+@pytest.fixture
+def two_threads():
+    # the held save must not keep the document load from running
+    pool = QThreadPool.globalInstance()
+    threads = pool.maxThreadCount()
+    pool.setMaxThreadCount(max(threads, 2))
+    yield
+    pool.setMaxThreadCount(threads)
+
+
+def test_save_finishing_after_open_keeps_the_new_journal(app, window, storage, tmp_path, monkeypatch, two_threads):
+    first, second = str(tmp_path / 'first.xml'), str(tmp_path / 'second.xml')
+    storage.save(first)
+    storage.save(second)
+    release = threading.Event()
+
+    def held_save(snapshot, filename, task):
+        release.wait()
+        return save_task(snapshot, filename, task)
+
+    monkeypatch.setattr(editor, 'save_task', held_save)
+    monkeypatch.setattr(QMessageBox, 'exec_', lambda self: 0)
+    open_document(app, window, first)
+    window._queueWrite(first, lambda: window._startSave(first))
+    open_document(app, window, second)
+    window.storage.addItem(Rectangle(QPoint(500, 500), QColor(1, 2, 3)))
+    # a save of the second document holds the same token number the first save got
+    window.storage.journal.checkpoint()
+    release.set()
+    wait(app, lambda: not window._writing)
+    assert window.storage.journal.document == second
+    assert window.storage.journal.pending == 1
+    with open(journal_path(first)) as f:
+        assert all(line == CHECKPOINT for line in f.readlines()[1:])